@@ -1,3 +1,15 @@
 from multifil import utilities
 from multifil import hs
-from multifil import aws
+from multifil import ensemble
+
+
+def __getattr__(name):
+    """Import the aws subpackage on first use, keeping import multifil light
+
+    Local runs and queue workers starting a fresh interpreter per job then
+    only load the cloud machinery when they actually touch multifil.aws.
+    """
+    if name == 'aws':
+        import importlib
+        return importlib.import_module('multifil.aws')
+    raise AttributeError("module 'multifil' has no attribute %r" % name)
@@ -8,6 +8,7 @@ Create and maintain a thin filament and the subgroups that comprise it.
 Created by Dave Williams on 2010-01-04.
 """
 
+import functools
 import numpy as np
 
 
@@ -28,6 +29,9 @@ class BindingSite:
         self.parent_thin = parent_thin_fil
         self.index = index
         self.address = ('bs', self.parent_thin.index, self.index)
+        # Permissiveness and binding partner live in the lattice's arrays
+        self._lattice = parent_thin_fil.parent_lattice
+        self._flat_index = self._lattice._add_binding_site(self)
         # Use the passed orientation index to choose the correct
         # orientation vector according to schema in ThinFilament docstring
         orientation_vectors = ((0.866, -0.5), (0, -1), (-0.866, -0.5),
@@ -64,6 +68,10 @@ class BindingSite:
         bsd = self.__dict__.copy()
         bsd.pop('index')
         bsd.pop('parent_thin')
+        bsd.pop('_lattice')
+        bsd.pop('_flat_index')
+        bsd['permissiveness'] = self.permissiveness
+        bsd['bound_to'] = self.bound_to
         if bsd['bound_to'] is not None:
             bsd['bound_to'] = bsd['bound_to'].address
         return bsd
@@ -138,6 +146,33 @@ class BindingSite:
         """Return the current numerical state, 0/unbound or 1/bound"""
         return self.bound_to is not None
 
+    @property
+    def permissiveness(self):
+        """Binding permissiveness, a view into the lattice's array"""
+        return float(self._lattice.bs_permissiveness.flat[self._flat_index])
+
+    @permissiveness.setter
+    def permissiveness(self, new_permissiveness):
+        """Record the new permissiveness in the lattice's array"""
+        self._lattice.bs_permissiveness.flat[self._flat_index] = \
+            new_permissiveness
+
+    @property
+    def bound_to(self):
+        """None if unbound, the Crossbridge we are bound to otherwise"""
+        xb_index = self._lattice.bs_bound[self._flat_index]
+        if xb_index < 0:
+            return None
+        return self._lattice._crossbridges[xb_index]
+
+    @bound_to.setter
+    def bound_to(self, crossbridge):
+        """Record the binding partner's index in the lattice's array"""
+        if crossbridge is None:
+            self._lattice.bs_bound[self._flat_index] = -1
+        else:
+            self._lattice.bs_bound[self._flat_index] = crossbridge._flat_index
+
     @property
     def lattice_spacing(self):
         """Get lattice spacing from the parent filament"""
@@ -178,6 +213,7 @@ class ThinFace:
         self.orientation = orientation
         self.binding_sites = binding_sites
         self.thick_face = None  # ThickFace instance this face interacts with
+        self._index_sites()
 
     def to_dict(self):
         """Create a JSON compatible representation of the thin face
@@ -192,6 +228,8 @@ class ThinFace:
         tfd = self.__dict__.copy()
         tfd.pop('index')
         tfd.pop('parent_thin')
+        tfd.pop('_site_nodes')
+        tfd.pop('_site_flat')
         tfd['thick_face'] = tfd['thick_face'].address
         tfd['binding_sites'] = [bs.address for bs in tfd['binding_sites']]
         return tfd
@@ -210,6 +248,29 @@ class ThinFace:
         # Sub-structure keys
         self.binding_sites = [self.parent_thin.resolve_address(bsa)
                               for bsa in tfd['binding_sites']]
+        self._index_sites()
+
+    def _index_sites(self):
+        """Record where this face's binding sites sit in the lattice arrays
+
+        Sites on a face are evenly spaced along the thin filament, so they
+        are kept as a slice and reading their locations is a view into the
+        thin filament's axial array rather than a copy.
+        """
+        nodes = np.array([site.index for site in self.binding_sites])
+        steps = np.unique(np.diff(nodes))
+        if len(steps) == 1 and steps[0] > 0:
+            self._site_nodes = slice(int(nodes[0]), int(nodes[-1]) + 1,
+                                     int(steps[0]))
+        else:
+            self._site_nodes = nodes
+        self._site_flat = np.array([site._flat_index
+                                    for site in self.binding_sites])
+
+    @property
+    def axial_locations(self):
+        """Axial locations of the binding sites on this face"""
+        return self.parent_thin.axial[self._site_nodes]
 
     def nearest(self, axial_location):
         """Where is the nearest binding site?
@@ -226,25 +287,34 @@ class ThinFace:
         Return:
             binding_site: the nearest binding site on this face
         """
-        # Next three lines of code enforce a jittery hiding, sometimes the
-        # binding site just beyond the hiding line can be accessed
-        hiding_line = self.parent_thin.hiding_line
-        axial_location = max(hiding_line, axial_location)
-        face_locs = [site.axial_location for site in self.binding_sites]
-        next_index = np.searchsorted(face_locs, axial_location)
+        return self.binding_sites[self.nearest_index([axial_location])[0]]
+
+    def nearest_index(self, axial_locations):
+        """Where are the nearest binding sites to many locations at once?
+
+        This is nearest for an array of locations, such as those of every
+        free cross-bridge facing this face, done in a single search.
+
+        Parameters:
+            axial_locations: the axial coordinates to seek matches for
+        Return:
+            indices: the position in binding_sites of each nearest site
+        """
+        # Enforce a jittery hiding, sometimes the binding site just beyond
+        # the hiding line can be accessed
+        axial_locations = np.maximum(self.parent_thin.hiding_line,
+                                     axial_locations)
+        face_locs = self.axial_locations
+        next_index = np.searchsorted(face_locs, axial_locations)
         prev_index = next_index - 1
-        # If not using a very short SL, where the end face loc is closest, 
-        # then find distances to two closest locations
-        if next_index != len(face_locs):
-            dists = np.abs((face_locs[prev_index] - axial_location,
-                            face_locs[next_index] - axial_location))
-        else:
-            return self.binding_sites[prev_index]  # If at end, return end
-        # If prior site was closer, give it, else give next
-        if dists[0] < dists[1]:
-            return self.binding_sites[prev_index]
-        else:
-            return self.binding_sites[next_index]
+        # At a very short SL the end face loc is closest, return the end
+        at_end = next_index == len(face_locs)
+        next_index[at_end] = prev_index[at_end]
+        # Otherwise if prior site was closer, give it, else give next
+        prev_closer = np.abs(face_locs[prev_index] - axial_locations) < \
+            np.abs(face_locs[next_index] - axial_locations)
+        return np.where(prev_closer | at_end, prev_index % len(face_locs),
+                        next_index)
 
     def radial_force(self):
         """What is the radial force this face experiences?
@@ -305,6 +375,59 @@ class ThinFace:
         return self.parent_thin.lattice_spacing
 
 
+@functools.lru_cache(maxsize=None)
+def _thin_geometry(start, face_orientations):
+    """Find which actin monomers of a thin filament face each thick filament
+
+    See ThinFilament.__init__ for the face orientations and Howard pg 125
+    for the axial positions. The result depends only on the arguments, so
+    it is cached and shared between every thin filament built with them;
+    the returned arrays are read-only.
+
+    Parameters:
+        start: which of the 26 actin monomers in an actin repeating unit
+            the filament begins with
+        face_orientations: tuple of faces' numerical orientation (0-5)
+    Returns:
+        steps: axial distance of each binding site from the first monomer
+        length: axial distance from the first monomer to the z-line
+        node_index_by_face: binding site indices opposite each face
+        face_index_by_node: which face each binding site is opposite
+    """
+    mono_per_poly = 26  # actin monomers in an actin polymer unit
+    poly_per_fil = 15  # actin polymers in a thin filament
+    polymer_base_length = 72.0  # nm per polymer unit length
+    polymer_base_turns = 12.0  # revolutions per polymer
+    rev = 2 * np.pi  # one revolution
+    pitch = polymer_base_turns * rev / mono_per_poly
+    rise = polymer_base_length / mono_per_poly
+    monomer_angles = [(((m + start + 1) % mono_per_poly) * pitch) % rev
+                      for m in range(mono_per_poly * poly_per_fil)]
+    # Convert face orientations to angles, then to angles from 0 to 2pi
+    orientation_vectors = ((0.866, -0.5), (0, -1.0), (-0.866, -0.5),
+                           (-0.866, 0.5), (0, 1.0), (0.866, 0.5))
+    face_vectors = [orientation_vectors[o] for o in face_orientations]
+    face_angles = [np.arctan2(v[1], v[0]) for v in face_vectors]
+    face_angles = [v + rev if (v < 0) else v for v in face_angles]
+    # Find which monomers are opposite each face
+    wiggle = rev / 24  # count faces within 15 degrees of opposite
+    mono_in_each_face = [np.nonzero(np.abs(np.subtract(
+        monomer_angles, angle)) < wiggle)[0] for angle in face_angles]
+    # Binding sites are the facing monomers in axial order, tie the nodes
+    # on each face into that order
+    monomers = np.sort(np.hstack(mono_in_each_face))
+    node_index_by_face = np.array([np.searchsorted(monomers, face)
+                                   for face in mono_in_each_face])
+    face_index_by_node = np.empty(len(monomers), dtype=int)
+    for face_ind, nodes in enumerate(node_index_by_face):
+        face_index_by_node[nodes] = face_ind
+    steps = monomers * rise
+    for array in (steps, node_index_by_face, face_index_by_node):
+        array.setflags(write=False)
+    return steps, mono_per_poly * poly_per_fil * rise, node_index_by_face, \
+        face_index_by_node
+
+
 class ThinFilament:
     """Each thin filament is made up of two actin strands.  The overall
     filament length at rest is 1119 nm [Tanner2007].  Each strand
@@ -374,47 +497,12 @@ class ThinFilament:
         # Remember who you are
         self.index = index
         self.address = ('thin_fil', self.index)
-        # TODO The creation of the monomer positions and angles should be refactored into a static function of similar.
-        # Figure out axial positions, see Howard pg 125
-        mono_per_poly = 26  # actin monomers in an actin polymer unit
-        poly_per_fil = 15  # actin polymers in a thin filament
-        polymer_base_length = 72.0  # nm per polymer unit length
-        polymer_base_turns = 12.0  # revolutions per polymer
-        rev = 2 * np.pi  # one revolution
-        pitch = polymer_base_turns * rev / mono_per_poly
-        rise = polymer_base_length / mono_per_poly
+        # Which monomers face the thick filaments depends only on the start
+        # and the face orientations, so is found once and reused
+        steps, length, node_index_by_face, face_index_by_node = \
+            _thin_geometry(start, tuple(face_orientations))
         # Monomer positions start near the m-line
-        monomer_positions = [(
-                                     self.z_line - mono_per_poly * poly_per_fil * rise) + m * rise
-                             for m in range(mono_per_poly * poly_per_fil)]
-        monomer_angles = [(((m + start + 1) % mono_per_poly) * pitch) % rev
-                          for m in range(mono_per_poly * poly_per_fil)]
-        # Convert face orientations to angles, then to angles from 0 to 2pi
-        orientation_vectors = ((0.866, -0.5), (0, -1.0), (-0.866, -0.5),
-                               (-0.866, 0.5), (0, 1.0), (0.866, 0.5))
-        face_vectors = [orientation_vectors[o] for o in face_orientations]
-        face_angles = [np.arctan2(v[1], v[0]) for v in face_vectors]
-        face_angles = [v + rev if (v < 0) else v for v in face_angles]
-        # Find which monomers are opposite each face
-        wiggle = rev / 24  # count faces within 15 degrees of opposite
-        mono_in_each_face = [np.nonzero(np.abs(np.subtract(monomer_angles,
-                                                           face_angles[i])) < wiggle)[0] for i in
-                             range(len(face_angles))]
-        # This is [(index_to_face_1, ...), (index_to_face_2, ...), ...]
-        # Translate monomer position to binding site position
-        axial_by_face = [[monomer_positions[mono_ind] for mono_ind in face]
-                         for face in mono_in_each_face]
-        axial_flat = np.sort(np.hstack(axial_by_face))
-        # Tie the nodes on each face into the flat axial locations
-        node_index_by_face = np.array([[np.nonzero(axial_flat == loc)[0][0]
-                                        for loc in f] for f in axial_by_face])
-        # V AMA 3-4-2020 V
-        # TODO figure out if this argument to np.tile is correct. Trust in CDW
-        # noinspection PyTypeChecker
-        face_index_by_node = np.tile(None, len(axial_flat))
-        for face_ind in range(len(node_index_by_face)):
-            for node_ind in node_index_by_face[face_ind]:
-                face_index_by_node[node_ind] = face_ind
+        axial_flat = (self.z_line - length) + steps
         # Create binding sites and thin faces
         self.binding_sites = []
         for index in range(len(axial_flat)):
@@ -430,7 +518,8 @@ class ThinFilament:
             self.thin_faces.append(
                 ThinFace(self, orientation, face_index, face_binding_sites))
         del (orientation, face_binding_sites)
-        # Remember the axial locations, both current and rest
+        # Remember the axial locations, both current and rest, the former
+        # as a view into the lattice's thin filament location array
         self.axial = axial_flat
         self.rests = np.diff(np.hstack([self.axial, self.z_line]))
         # Other thin filament properties to remember
@@ -457,7 +546,7 @@ class ThinFilament:
         thin_d.pop('parent_lattice')  # TODO: Spend a P on an id for the lattice
         thin_d['thick_faces'] = [tf.address for tf in thin_d['thick_faces']]
         thin_d['thin_faces'] = [tf.to_dict() for tf in thin_d['thin_faces']]
-        thin_d['axial'] = list(thin_d['axial'])
+        thin_d['axial'] = list(self.axial)
         thin_d['rests'] = list(thin_d['rests'])
         thin_d['binding_sites'] = [bs.to_dict() for bs in
                                    thin_d['binding_sites']]
@@ -640,6 +729,16 @@ class ThinFilament:
         assert (len(flat_axial_locs) == len(self.axial))
         self.axial = flat_axial_locs
 
+    @property
+    def axial(self):
+        """Axial locations of the nodes, a view into the lattice's array"""
+        return self.parent_lattice.thin_axial[self.index]
+
+    @axial.setter
+    def axial(self, new_axial):
+        """Write new node locations into the lattice's array"""
+        self.parent_lattice.thin_axial[self.index] = new_axial
+
     @property
     def z_line(self):
         return self.parent_lattice.z_line
@@ -657,8 +756,7 @@ class ThinFilament:
     @permissiveness.setter
     def permissiveness(self, new_permissiveness):
         """Assign all binding sites the new permissiveness"""
-        for site in self.binding_sites:
-            site.permissiveness = new_permissiveness
+        self.parent_lattice.bs_permissiveness[self.index] = new_permissiveness
 
     def get_binding_site(self, index):
         """Return a link to the binding site site at index"""
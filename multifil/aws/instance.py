@@ -11,10 +11,11 @@ import os
 import traceback
 import time
 import optparse
+import gc
+import resource
 import urllib.request
 import multiprocessing as mp
-import boto
-from . import run
+from . import run, queues
 
 ## Reporting to SQS
 # This is a bit hacky and I don't like it
@@ -24,9 +25,10 @@ try:
         timeout=3) as response:
         ip4 = response.read().decode()
     log_to_sqs=True
+    import boto
     sqs = boto.connect_sqs()
     logging_queue = sqs.get_queue('status-queue')
-except urllib.error.URLError:
+except (OSError, ImportError): # URLError and connection errors off of EC2
     log_to_sqs=False
 
 
@@ -36,8 +38,11 @@ def log_it(log_message):
     identified_message = "instance.py :" + mp.current_process().name +  \
             " ## " + log_message
     print(identified_message)
-    with open('/dev/console', 'w') as console:
-        console.write(identified_message + '\n')
+    try:
+        with open('/dev/console', 'w') as console:
+            console.write(identified_message + '\n')
+    except OSError:
+        pass # no console to write to off of EC2
     if log_to_sqs:
         oclock = time.strftime('%a,%H:%M') + " - "
         msg = oclock + ip4 + " - "+mp.current_process().name+": "+log_message
@@ -54,7 +59,7 @@ def running_error(exception):
     """An error that occurred while running a job"""
     log_it("### An error occurred while running jobs")
     log_it("Exception of type " + str(type(exception)) +
-           ": " + exception.message)
+           ": " + str(exception))
     exc_type, exc_value, exc_traceback = sys.exc_info()
     log_it(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
 
@@ -62,44 +67,164 @@ def halt_system():
     """Shut it down"""
     os.system("shutdown now -h")
 
+def run_meta(metafile):
+    """Run a metafile, exiting with the run's exitcode so that the process
+    running it reports whether the run finished"""
+    _, exitcode = run.manage(metafile, unattended=False).run_and_save()
+    sys.exit(exitcode)
+
+
+## Keep a worker warm between tasks
+class warm_worker:
+    """A long-lived process that runs meta files one after another
+
+    A fresh process per meta file has to load the model's modules, its
+    compiled numba kernels, and its tabulated rates anew for each run. A
+    warm worker keeps its interpreter, and with it all of these, from one
+    run to the next. Each run still builds its own sarcomere, since the
+    filament starts, and so the lattice, are drawn from the run's seed.
+    The worker is replaced with a fresh one after max_jobs runs, or once
+    its peak memory passes max_memory, so that any growth can't build up.
+    """
+
+    def __init__(self, max_jobs=None, max_memory=None):
+        """Start the worker process
+
+        Parameters
+        ----------
+        max_jobs: int
+            runs before the worker is replaced, never if None
+        max_memory: float
+            peak resident memory, in MB, past which the worker is replaced
+            after its current run, never if None
+        """
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.process = None
+        self._start()
+
+    def _start(self):
+        """Start a fresh worker process"""
+        self.connection, worker_connection = mp.Pipe()
+        self.process = mp.Process(target=self._work, args=(worker_connection,))
+        self.process.start()
+        self.jobs = 0
+        self.memory = 0
+        self.exitcode = None
+
+    @staticmethod
+    def _work(connection):
+        """Run each meta file sent until sent None, replying to each with
+        the run's exitcode and the peak memory used so far in MB"""
+        for metafile in iter(connection.recv, None):
+            try:
+                _, exitcode = run.manage(metafile, unattended=False).run_and_save()
+            except Exception as e:
+                running_error(e)
+                exitcode = 1
+            gc.collect() # let go of the run before the next one
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            connection.send((exitcode, memory))
+
+    def recycle(self):
+        """Replace the worker process with a fresh one"""
+        self.close()
+        self._start()
+
+    def submit(self, metafile):
+        """Start a run, first replacing the worker if it has done too much"""
+        used_up = self.max_jobs is not None and self.jobs >= self.max_jobs
+        too_big = self.max_memory is not None and self.memory > self.max_memory
+        if used_up or too_big or not self.process.is_alive():
+            log_it("Recycling warm worker after %i jobs, %i MB" % (
+                self.jobs, self.memory))
+            self.recycle()
+        self.exitcode = None
+        self.connection.send(metafile)
+
+    def is_alive(self):
+        """Is the current run still going? If not, its exitcode is set"""
+        if self.connection.poll():
+            self.exitcode, self.memory = self.connection.recv()
+            self.jobs += 1
+            return False
+        if not self.process.is_alive():
+            self.process.join()
+            self.exitcode = self.process.exitcode or 1
+            return False
+        return True
+
+    def close(self):
+        """Stop the worker once it is done with any run underway"""
+        if self.process.is_alive():
+            self.connection.send(None)
+        self.process.join()
+
 
 ## Munch tasks off a queue
 class queue_eater:
-    def __init__(self,  sqs_queue_name, id=None, secret=None, shutdown=True):
-        """Consume an SQS queue. The queue consists of metafile locations.
+    def __init__(self, queue, id=None, secret=None, shutdown=True, poll=0.5,
+                 warm=False, max_jobs=None, max_memory=None):
+        """Consume a job queue. The queue consists of metafile locations.
         These locations are spun off into run.manage instances and the queue
-        messages are deleted after the run.manage returns.
+        messages are deleted after the run.manage returns, or given back to
+        the queue if it fails.
 
         Parameters
         ----------
-        sqs_queue_name: string
-            name of the queue to eat
+        queue: string or queue
+            name of the SQS queue to eat, or a queue from aws.queues, such
+            as a queues.local_queue
         id: string
-            optional AWS id access key
+            optional AWS id access key, for an SQS queue
         secret: string
-            optional AWS secret key
+            optional AWS secret key, for an SQS queue
         shutdown: boolean
             if True, will shutdown on errors
+        poll: float
+            seconds between checks on the running process (0.5)
+        warm: boolean
+            if True, run the metafiles one after another in a warm_worker
+            rather than in a new process each
+        max_jobs: int
+            runs before a warm worker is replaced, never if None
+        max_memory: float
+            peak MB of memory past which a warm worker is replaced, never
+            if None
         """
-        self.name = sqs_queue_name
+        self.name = queue if isinstance(queue, str) else repr(queue)
         self.id = id
         self.secret = secret
         self.should_shutdown = shutdown
-        self._connect_to_queue()
+        self.poll = poll
+        self.worker = None
+        if warm:
+            self.worker = warm_worker(max_jobs, max_memory)
+        if isinstance(queue, str):
+            self._connect_to_queue()
+        else:
+            self.queue = queue
         self.new_meta() # Load first meta msg
         try:
             if self.meta is not None: # in case queue is empty
                 self.new_proc()
             while self.meta is not None:
                 if not self.proc_alive():
-                    if self.process.exitcode==0:
+                    if self.exitcode==0:
                         self.delete_meta()
+                    else:
+                        self.release_meta()
                     self.new_meta()
                     if self.meta is not None:
                         self.new_proc()
+                else:
+                    self.queue.keep_alive(self.meta)
+                    time.sleep(self.poll)
         except Exception as e:
             running_error(e)
             self.shutdown()
+        if self.worker is not None:
+            self.worker.close()
         log_it("Ate all we can, queue eater out")
         return
 
@@ -107,10 +232,7 @@ class queue_eater:
         """Connect to our sqs queue"""
         try:
             log_it("Connecting to SQS queue "+self.name)
-            sqs = boto.connect_sqs(self.id, self.secret)
-            self.queue = sqs.get_queue(self.name)
-            if type(self.queue) is type(None):
-                raise KeyError("Provided queue name not found")
+            self.queue = queues.sqs_queue(self.name, self.id, self.secret)
         except KeyError:
             fatal_error("Given queue non-existent", "a different queue name",
                         self.should_shutdown)
@@ -118,26 +240,34 @@ class queue_eater:
     def new_proc(self):
         """Launch a new process from the current meta message"""
         try:
-            self.message_body = self.meta.get_body()
+            self.message_body = self.queue.body(self.meta)
             log_it("Gonna run "+self.message_body)
-            self.process = mp.Process(target = run.manage,
-                                      args = (self.message_body,))
-            self.process.start()
+            if self.worker is not None:
+                self.worker.submit(self.message_body)
+            else:
+                self.process = mp.Process(target = run_meta,
+                                          args = (self.message_body,))
+                self.process.start()
             self.start_time = time.time()
         except Exception as e:
             running_error(e)
             self.shutdown()
 
     def proc_alive(self):
-        """Is the process alive?"""
-        if self.process.is_alive():
+        """Is the process alive? If not, the run's exitcode is set"""
+        if self.worker is not None:
+            if self.worker.is_alive():
+                return True
+            self.exitcode = self.worker.exitcode
+        elif self.process.is_alive():
             return True
         else:
             self.process.join() # wait until process really terminates
-            took = int(time.time() - self.start_time)
-            hr, min, sec = took/60/60, took/60%60, took%60
-            log_it("Took %i:%i:%i to run %s"%(hr, min, sec, self.message_body))
-            return False
+            self.exitcode = self.process.exitcode
+        took = int(time.time() - self.start_time)
+        hr, min, sec = took/60/60, took/60%60, took%60
+        log_it("Took %i:%i:%i to run %s"%(hr, min, sec, self.message_body))
+        return False
 
     def new_meta(self):
         """Read the next meta message"""
@@ -145,7 +275,12 @@ class queue_eater:
 
     def delete_meta(self):
         """Delete the current meta message"""
-        self.queue.delete_message(self.meta)
+        self.queue.delete(self.meta)
+
+    def release_meta(self):
+        """Give the current, failed, meta message back to the queue"""
+        log_it("Run of "+self.message_body+" failed, returning it to the queue")
+        self.queue.release(self.meta)
 
     def shutdown(self):
         """Turn off instance"""
@@ -155,11 +290,14 @@ class queue_eater:
 
 
 ## Many munching mouths
-def multi_eaters(sqs_queue_name, num=None, id=None, secret=None, shutdown=True):
-    """Launch a number of queue eaters"""
+def multi_eaters(queue, num=None, id=None, secret=None, shutdown=True,
+                 warm=False, max_jobs=None, max_memory=None):
+    """Launch a number of queue eaters on an SQS queue name or a queue from
+    aws.queues, optionally each with a warm worker, see queue_eater"""
     if num is None:
         num = mp.cpu_count()
-    queue_eater_args = (sqs_queue_name, id, secret, shutdown)
+    queue_eater_args = (queue, id, secret, shutdown, 0.5, warm, max_jobs,
+                        max_memory)
     eaters = [mp.Process(target=queue_eater, args = queue_eater_args) \
               for i in range(num)]
     [e.start() for e in eaters]
@@ -182,6 +320,9 @@ def main(argv=None):
     parser.add_option('-q', '--queue', dest="queue_name",
                       default="job_queue", type='string',
                       help='set the queue to look for commands in')
+    parser.add_option('-l', '--local', dest="local_queue",
+                      default=None, type='string',
+                      help='eat a local directory queue instead of SQS')
     parser.add_option('-i', '--id', dest="id",
                       default=None, type='string',
                       help='what aws id credential to use')
@@ -191,12 +332,25 @@ def main(argv=None):
     parser.add_option('-m', '--multiprocessing', action="store_const",
                       dest="proc_num", default=1, const=mp.cpu_count(),
                       help='run as many copies as there are cores [False]')
+    parser.add_option('-w', '--warm', action="store_true",
+                      dest="warm", default=False,
+                      help='run jobs in long-lived warm workers [False]')
+    parser.add_option('--max-jobs', dest="max_jobs",
+                      default=None, type='int',
+                      help='jobs before a warm worker is replaced')
+    parser.add_option('--max-memory', dest="max_memory",
+                      default=None, type='float',
+                      help='peak MB before a warm worker is replaced')
     parser.add_option('--halt', action="store_true",
                       dest="the_end_of_the_end", default=False,
                       help='shutdown computer on completion or error [False]')
     (options, args) = parser.parse_args(argv)
-    multi_eaters(options.queue_name, options.proc_num, options.id,
-                 options.secret, options.the_end_of_the_end)
+    queue = options.queue_name
+    if options.local_queue is not None:
+        queue = queues.local_queue(options.local_queue)
+    multi_eaters(queue, options.proc_num, options.id,
+                 options.secret, options.the_end_of_the_end, options.warm,
+                 options.max_jobs, options.max_memory)
     return 0 #Successful termination
 
 
@@ -136,7 +136,8 @@ def actin_permissiveness_workloop(freq, phase, stim_duration,
 
 # ## Configure a run via a saved meta file
 def emit(path_local, path_s3, time, poisson=0.0, ls=None, z_line=None, actin_permissiveness=None, comment=None,
-         write=True, **kwargs):
+         write=True, seed=None, recording=None, termination=None,
+         **kwargs):
     # noinspection PyTypeChecker
     """Produce a structured JSON file that will be consumed to create a run
 
@@ -171,6 +172,21 @@ def emit(path_local, path_s3, time, poisson=0.0, ls=None, z_line=None, actin_per
     write: bool, optional
         True (default) writes file to path_local/name.meta.json. Other values
         don't. In both cases the dictionary describing the run is returned.
+    seed: int, optional
+        Seed of the run's random stream, making the run repeatable. If not
+        given, the seed is drawn from the OS when the run starts and is
+        recorded with the sarcomere.
+    recording: dict, optional
+        Which values to record and how often, see run.data_file.
+        parse_recording. For example {'metrics': {'axial_force': 1,
+        'xb_fraction_tight': {'every': 10, 'average': True}}, 'profiles':
+        {'crown_force': 100}}. If not given, every metric is recorded at
+        every timestep and no profiles are.
+    termination: dict, optional
+        When to stop the run before the end of the time trace, see
+        run.termination. For example {'metrics': ['axial_force'], 'mode':
+        'steady', 'window': 200, 'tolerance': 0.005}. If not given, the
+        run goes to the end of the time trace.
     **kwargs:
         Further keyword args will be included in the output dictionary. These
         are used to sort the resulting runs by their properties of interest.
@@ -212,6 +228,11 @@ def emit(path_local, path_s3, time, poisson=0.0, ls=None, z_line=None, actin_per
     run_d['actin_permissiveness'] = actin_permissiveness
     run_d['timestep_length'] = np.diff(time)[0]
     run_d['timestep_number'] = len(time)
+    run_d['seed'] = seed
+    if recording is not None:
+        run_d['recording'] = recording
+    if termination is not None:
+        run_d['termination'] = termination
     # ## Include kwargs
     for k in kwargs:
         run_d[k] = kwargs[k]
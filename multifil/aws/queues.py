@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+queues.py - the job queues a queue_eater can consume
+
+A job queue holds the locations of meta files to be run. Each queue here
+offers the same few calls, so instance.queue_eater works the same way
+whatever sits behind it:
+
+    read(): claim the next message, or None if there are none
+    body(message): the meta file location a message holds
+    delete(message): acknowledge a message whose run finished
+    release(message): give a message whose run failed back to the queue
+    keep_alive(message): hold on to a message whose run is still going
+
+queues.sqs_queue is the SQS queue the cluster is fed from. queues.local_queue
+keeps its messages as files in a directory, for shared file systems and big
+single machines, with no cloud services needed.
+
+Example
+--------
+>>> from multifil.aws import queues, instance
+>>> jobs = queues.local_queue('./jobs')
+>>> jobs.put('./runs/0b1c.meta.json')
+>>> instance.queue_eater(jobs, shutdown=False)
+"""
+
+import os
+import time
+import uuid
+
+
+class sqs_queue:
+    """An SQS queue of meta file locations"""
+
+    def __init__(self, name, id=None, secret=None):
+        """Connect to the named SQS queue
+
+        boto is imported here, rather than with the module, so that local
+        queues never need it.
+
+        Parameters
+        ----------
+        name: string
+            name of the queue
+        id: string
+            optional AWS id access key
+        secret: string
+            optional AWS secret key
+        """
+        import boto
+        self.name = name
+        sqs = boto.connect_sqs(id, secret)
+        self.queue = sqs.get_queue(name)
+        if self.queue is None:
+            raise KeyError("Provided queue name not found")
+
+    def put(self, body):
+        """Add a message holding a meta file location"""
+        self.queue.write(self.queue.new_message(body))
+
+    def read(self):
+        """Claim the next message, None if the queue is empty"""
+        return self.queue.read()
+
+    @staticmethod
+    def body(message):
+        """The meta file location a message holds"""
+        return message.get_body()
+
+    def delete(self, message):
+        """Acknowledge a finished message, removing it from the queue"""
+        self.queue.delete_message(message)
+
+    def release(self, message):
+        """Leave a failed message to reappear once its visibility timeout
+        ends, as SQS moves it to any dead-letter queue it is set up with"""
+        pass
+
+    def keep_alive(self, message):
+        """SQS holds claimed messages for the queue's visibility timeout"""
+        pass
+
+
+class local_queue:
+    """A queue of meta file locations kept as files in a directory
+
+    Messages are files in the pending folder. A message is claimed by
+    renaming it into the claimed folder, which only one of any number of
+    readers can do, and deleted once its run finishes. A claimed message
+    whose claim is not kept alive for visibility_timeout seconds, as when
+    its worker has crashed, goes back to pending. A message that has been
+    claimed max_attempts times without finishing is moved to the dead
+    folder instead.
+
+    Directory layout:
+        pending/: messages waiting to be claimed
+        claimed/: messages being run, modified time is the latest claim
+            or keep_alive
+        dead/: messages given up on
+        tmp/: messages being written, before being put in pending
+    Messages are named <put time>-<uuid>.<attempts>, so that they are
+    claimed in the order they were put.
+    """
+
+    FOLDERS = ('pending', 'claimed', 'dead', 'tmp')
+
+    def __init__(self, path, visibility_timeout=3600, max_attempts=3):
+        """Open the queue at a directory, creating it if needed
+
+        Parameters
+        ----------
+        path: string
+            directory of the queue
+        visibility_timeout: float
+            seconds a claimed message is held without a keep_alive before
+            it is given to another reader (3600)
+        max_attempts: int
+            claims of a message before it is moved to dead (3)
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        for folder in self.FOLDERS:
+            os.makedirs(self._folder(folder), exist_ok=True)
+
+    def _folder(self, folder, name=''):
+        """Location of a folder of the queue, or of a message in it"""
+        return os.path.join(self.path, folder, name)
+
+    def put(self, body):
+        """Add a message holding a meta file location"""
+        name = "%017.6f-%s.0" % (time.time(), uuid.uuid4().hex)
+        with open(self._folder('tmp', name), 'w') as message:
+            message.write(body)
+        os.rename(self._folder('tmp', name), self._folder('pending', name))
+
+    def count(self, folder='pending'):
+        """Number of messages in one of the queue's folders"""
+        return len(os.listdir(self._folder(folder)))
+
+    def _move(self, source, name):
+        """Rename a message out of a folder, to pending to be claimed again
+        or to dead if it has been claimed too many times. Returns False if
+        another reader moved it first."""
+        stem, claims = name.rsplit('.', 1)
+        claims = int(claims)
+        folder = 'pending' if claims < self.max_attempts else 'dead'
+        try:
+            os.rename(self._folder(source, name),
+                      self._folder(folder, stem + '.' + str(claims)))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def requeue_expired(self):
+        """Return claimed messages not kept alive within the visibility
+        timeout to pending, or to dead if out of attempts"""
+        now = time.time()
+        for name in os.listdir(self._folder('claimed')):
+            try:
+                modified = os.path.getmtime(self._folder('claimed', name))
+            except FileNotFoundError:
+                continue  # finished or requeued by another reader
+            if now - modified > self.visibility_timeout:
+                self._move('claimed', name)
+
+    def read(self):
+        """Claim the next message, None if the queue is empty
+
+        Returns
+        -------
+        message: string
+            location of the claimed message file
+        """
+        self.requeue_expired()
+        for name in sorted(os.listdir(self._folder('pending'))):
+            stem, claims = name.rsplit('.', 1)
+            pending = self._folder('pending', name)
+            claimed = self._folder('claimed', stem + '.' + str(int(claims) + 1))
+            try:
+                # Renaming keeps the modified time, so start the claim's
+                # clock first, lest a long wait in pending look expired
+                os.utime(pending)
+                os.rename(pending, claimed)
+            except FileNotFoundError:
+                continue  # claimed by another reader first
+            return claimed
+        return None
+
+    @staticmethod
+    def body(message):
+        """The meta file location a message holds"""
+        with open(message, 'r') as message_file:
+            return message_file.read()
+
+    def delete(self, message):
+        """Acknowledge a finished message, removing it from the queue"""
+        try:
+            os.remove(message)
+        except FileNotFoundError:
+            pass  # held too long and requeued, it will be run again
+
+    def release(self, message):
+        """Give a failed message back to pending, or to dead if it has been
+        claimed max_attempts times"""
+        self._move('claimed', os.path.basename(message))
+
+    def keep_alive(self, message):
+        """Renew the claim on a message whose run is still going"""
+        try:
+            os.utime(message)
+        except FileNotFoundError:
+            pass
@@ -9,7 +9,12 @@ produced by setup_run.emit and uses it to configure a sarcomere
 
 run.sarc_file manages recording of complete sarcomere logs to a local file
 
-run.data_file manages recording abbreviated data logs to a local file
+run.trajectory_file does the same in a compact keyframe and delta format
+
+run.data_file manages recording abbreviated data logs to a local file, kept
+in columns as the run goes and exported to JSON at its end
+
+run.termination stops a run early once the metrics it watches converge
 
 run.s3 maintains a persistent s3 connection through all of this
 
@@ -18,22 +23,25 @@ Created by Dave Williams on 2016-07-02
 
 import sys
 import os
+import collections
 import shutil
 import subprocess
+import tarfile
 import time
 import multiprocessing as mp
-import boto
+import multiprocessing.connection
 import numpy as np
 
 from multifil import hs
-from multifil.utilities import use_aws, json
+from multifil.utilities import use_aws, json, instrument, trajectory, columns, cache
 
 
 # ## Manage a local run
 class manage:
     """Run, now with extra object flavor"""
 
-    def __init__(self, metafile, unattended=True, use_sarc=True, live_update=None):
+    def __init__(self, metafile, unattended=True, use_sarc=True, live_update=None, seed=None,
+                 instrumented=False, result_cache=None):
         """Create a managed instance of the sarc, optionally running it
 
         Parameters
@@ -45,16 +53,48 @@ class manage:
         unattended: boolean
             Whether to complete the run without further intervention or treat
             as an interactive session.
+        use_sarc: boolean or "trajectory"
+            Whether to record the complete sarcomere at each timestep, as JSON
+            in a sarc file if True or in the compact format of
+            utilities.trajectory if "trajectory".
+        seed: int or numpy SeedSequence, optional
+            Seed of the sarc's random stream, overriding any 'seed' in the
+            meta file.
+        instrumented: boolean
+            Whether to record the time and counts of each timestep, see
+            utilities.instrument, and save them beside the data file as
+            name.instruments.json.
+        result_cache: string or utilities.cache.result_cache, optional
+            Store of finished runs' results, or the directory of one. A
+            seeded run whose meta settings, seed, model version, and output
+            files match a stored run's has the stored results copied out
+            as its own rather than being run; a finished seeded run is
+            stored. The cache is checked by run_and_save, so a hit has
+            still built the sarc and working directory here.
+
+        A 'termination' plan in the meta file stops the run once the
+        metrics it watches reach a steady state or repeat from cycle to
+        cycle, see run.termination; why and when it stopped is recorded
+        in the data file as 'termination'.
         """
         if use_aws:
             self.s3 = s3()
         else:
             self.s3 = None
         self.uuid = os.path.basename(metafile).split('.')[0]
-        self.working_dir = self._make_working_dir(self.uuid)
+        self.working_dir = self._make_working_dir(metafile)
         self.metafile = self._parse_metafile_location(metafile)
         self.meta = self.unpack_meta(self.metafile)
-        self.sarc = self.unpack_meta_to_sarc(self.meta)
+        self.sarc = self.unpack_meta_to_sarc(self.meta, seed)
+        self.seed = self.meta.get('seed') if seed is None else seed
+        if isinstance(result_cache, str):
+            result_cache = cache.result_cache(result_cache)
+        self.result_cache = result_cache
+        self.terminator = None
+        if self.meta.get('termination') is not None:
+            self.terminator = termination(self.sarc, self.meta['termination'])
+        if instrumented:
+            self.sarc.instruments = instrument.instruments()
         self.use_sarc = use_sarc
         self.live_update = live_update
         self.sarcfile = None
@@ -69,9 +109,14 @@ class manage:
                 print(e)
 
     @staticmethod
-    def _make_working_dir(name):
+    def working_dir_name(metafile):
+        """Name of the temporary working directory of a run of metafile"""
+        return '/tmp/' + os.path.basename(metafile).split('.')[0]
+
+    @classmethod
+    def _make_working_dir(cls, metafile):
         """Create a temporary working directory and return the name"""
-        wd_name = '/tmp/' + name
+        wd_name = cls.working_dir_name(metafile)
         os.makedirs(wd_name, exist_ok=True)
         return wd_name
 
@@ -91,9 +136,9 @@ class manage:
         return meta
 
     @staticmethod
-    def unpack_meta_to_sarc(meta):
+    def unpack_meta_to_sarc(meta, seed=None):
         """Unpack the local meta file and instantiate a sarc as defined
-        in the meta file
+        in the meta file, seeded by the passed seed or else the meta's
         """
         # Prep single values for instantiation of hs
         none_if_list = lambda s: None if type(meta[s]) is list else meta[s]
@@ -113,6 +158,7 @@ class manage:
             actin_permissiveness=actin_permissiveness,
             timestep_len=meta['timestep_length'],
             time_dependence=time_dep_dict,
+            seed=meta.get('seed') if seed is None else seed,
         )
         return sarc
 
@@ -136,8 +182,12 @@ class manage:
         if self.meta['path_local'] is not None:
             local_loc = os.path.abspath(os.path.expanduser(
                 self.meta['path_local'])) + file_name
+            # Copy beside the destination, then rename into place, so a run
+            # stopped midway never leaves a half written file, such as a
+            # truncated copy of the meta file it was started from
             try:
-                shutil.copyfile(temp_loc, local_loc)
+                shutil.copyfile(temp_loc, local_loc + '.part')
+                os.replace(local_loc + '.part', local_loc)
             except shutil.SameFileError:
                 pass
         # Save to passes local location
@@ -151,26 +201,42 @@ class manage:
         results to meta-specified s3 and local locations"""
         exitcode = None
         result = None
+        outputs = []  # files copied to the final locations, to be cached
+
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.key(self.meta, self.seed, self.sarc.version,
+                                              use_sarc=self.use_sarc)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return self._restore_from_cache(cached)
 
         try:
             # Initialize data and sarc
-            if self.use_sarc:
+            if self.use_sarc == "trajectory":
+                self.sarcfile = trajectory_file(self.sarc, self.meta, self.working_dir)
+            elif self.use_sarc:
                 self.sarcfile = sarc_file(self.sarc, self.meta, self.working_dir)
             self.datafile = data_file(self.sarc, self.meta, self.working_dir)
             # Run away
-            # noinspection PyArgumentList
-            np.random.seed()
             tic = time.time()
 
             for timestep in range(self.meta['timestep_number']):
                 self.sarc.timestep(timestep)
+                tic_output = time.perf_counter()
                 self.datafile.append()
                 if self.live_update is not None and timestep % self.live_update == 0:
-                    self.datafile.finalize()
+                    self.datafile.flush()
                 if self.use_sarc:
                     self.sarcfile.append()
+                if self.sarc.instruments is not None:
+                    self.sarc.instruments.add_time('output', time.perf_counter() - tic_output)
                 # Update on how it is going
                 self._run_status(timestep, tic, 100)
+                if self.terminator is not None and self.terminator.check():
+                    self._log_it("%s at timestep %i, stopping early" % (
+                        self.terminator.reason, self.terminator.timestep))
+                    break
 
             # Finalize and save files to final locations
             self._log_it("model finished, uploading")
@@ -188,15 +254,30 @@ class manage:
             # we need to finalize what we have.
             # READ: orphaned files in /tmp/ are disallowed now.
             if self.datafile is not None:
+                if self.terminator is not None:
+                    self.datafile.termination = self.terminator.record()
                 result = self.datafile.data_dict.copy()
                 data_final_name = self.datafile.finalize()
-                self._copy_file_to_final_location(data_final_name)
-                self.datafile.delete()  # clean up temp files
+                outputs += [data_final_name] + self.datafile.columns_filenames
 
             if self.use_sarc and self.sarcfile is not None:
-                sarc_final_name = self.sarcfile.finalize()
-                self._copy_file_to_final_location(sarc_final_name)
-                self.sarcfile.delete()  # clean up temp files
+                outputs.append(self.sarcfile.finalize())
+
+            for output in outputs:
+                self._copy_file_to_final_location(output)
+            if exitcode == 0 and cache_key is not None:
+                self.result_cache.put(cache_key, self.meta['name'], outputs)
+            # Clean up temp files
+            if self.datafile is not None:
+                self.datafile.delete()
+            if self.use_sarc and self.sarcfile is not None:
+                self.sarcfile.delete()
+
+            if self.sarc.instruments is not None:
+                instrument_name = self.sarc.instruments.write(
+                    self.working_dir + '/' + self.meta['name'] + '.instruments.json')
+                self._copy_file_to_final_location(instrument_name)
+                os.remove(instrument_name)
 
             self._copy_file_to_final_location(self.metafile)
             os.remove(self.metafile)
@@ -205,6 +286,44 @@ class manage:
             self._log_it("uploading finished, done with this run")
             return result, exitcode
 
+    def _restore_from_cache(self, files):
+        """Copy a stored run's files to the final locations as this run's,
+        in place of running it, and return its data dict and exitcode
+
+        The stored run's name is replaced with this run's wherever the
+        files record it: in the data dict, the columns files' attributes,
+        and the name of the sarc file within its tarball.
+        """
+        self._log_it("found in the result cache, copying stored results")
+        result = None
+        for suffix, stored in files.items():
+            working_name = self.working_dir + '/' + self.meta['name'] + '.' + suffix
+            if suffix == 'data.json':
+                with open(stored, 'r') as datafile:
+                    result = json.load(datafile)
+                result['name'] = self.meta['name']
+                with open(working_name, 'w') as datafile:
+                    json.dump(result, datafile, sort_keys=True)
+            elif suffix.endswith('.columns'):
+                columns.copy(stored, working_name, {'name': self.meta['name']})
+            elif suffix == 'sarc.tar.gz':
+                with tarfile.open(stored) as stored_tar, \
+                        tarfile.open(working_name, 'w:gz') as working_tar:
+                    for member in stored_tar.getmembers():
+                        sarc_json = stored_tar.extractfile(member)
+                        # Named as sarc_file.finalize's tar names it
+                        member.name = (self.working_dir + '/' + self.meta['name'] +
+                                       '.sarc.json').lstrip('/')
+                        working_tar.addfile(member, sarc_json)
+            else:
+                shutil.copyfile(stored, working_name)
+            self._copy_file_to_final_location(working_name)
+            os.remove(working_name)
+        self._copy_file_to_final_location(self.metafile)
+        os.remove(self.metafile)
+        os.rmdir(self.working_dir)
+        return result, 0
+
     def _run_status(self, timestep, start, every):
         """Report the run status"""
         if timestep % every == 0 or timestep == 0:
@@ -223,6 +342,113 @@ class manage:
         sys.stdout.flush()
 
 
+# ## Stopping a run early
+class termination:
+    """Watch recorded metrics and call a run done once they stop changing"""
+
+    MODES = ('steady', 'periodic')
+
+    def __init__(self, sarc, plan):
+        """Set up the watch described by a meta file's 'termination' plan
+
+        Parameters:
+            sarc: the hs.hs being run
+            plan: dict of
+                metrics: hs.hs.METRICS to watch (["axial_force"])
+                mode: "steady" (default) to stop once the mean of each
+                    metric over the latest window of timesteps is within
+                    tolerance of its mean over the window before, or
+                    "periodic" to stop once each metric's trace over the
+                    latest period is within tolerance, as an RMS
+                    difference, of its trace over the period before
+                window: timesteps averaged over in "steady" mode (100)
+                period: timesteps in a cycle, required in "periodic" mode
+                tolerance: allowed change relative to the size of the
+                    latest window's mean, or of its RMS if periodic (0.01)
+                absolute_tolerance: change always allowed, useful for
+                    metrics that settle near zero (0)
+                min_timesteps: timesteps run before stopping is
+                    considered (0)
+        """
+        self.sarc = sarc
+        self.metrics = list(plan.get('metrics', ['axial_force']))
+        unknown = set(self.metrics) - set(hs.hs.METRICS)
+        if unknown:
+            raise ValueError("Unknown metrics to watch: %s" %
+                             ", ".join(sorted(unknown)))
+        self.mode = plan.get('mode', 'steady')
+        if self.mode == 'steady':
+            self.window = int(plan.get('window', 100))
+        elif self.mode == 'periodic':
+            if plan.get('period') is None:
+                raise ValueError("A periodic termination needs a period")
+            self.window = int(plan['period'])
+        else:
+            raise ValueError("Termination mode must be one of %s, not %s" %
+                             (self.MODES, self.mode))
+        if self.window < 1:
+            raise ValueError("Termination window must be at least one "
+                             "timestep")
+        self.tolerance = float(plan.get('tolerance', 0.01))
+        self.absolute_tolerance = float(plan.get('absolute_tolerance', 0))
+        self.min_timesteps = int(plan.get('min_timesteps', 0))
+        # The latest two windows of each metric, oldest first, filled as a
+        # ring whose next entry is at self._steps % (2 * window)
+        self._history = np.zeros((len(self.metrics), 2 * self.window))
+        self._steps = 0
+        self.reason = None
+        self.timestep = None
+        self.change = None
+
+    def check(self):
+        """Record this timestep's metrics and see if the run is done
+
+        Returns:
+            done: True once the watched metrics have converged, after
+                which reason, timestep, and change describe the stop
+        """
+        values = self.sarc.metrics(self.metrics)
+        self._history[:, self._steps % (2 * self.window)] = \
+            [values[name] for name in self.metrics]
+        self._steps += 1
+        if self._steps < max(2 * self.window, self.min_timesteps):
+            return False
+        if self.mode == 'periodic' and self._steps % self.window != 0:
+            return False  # compare whole cycles only, start to start
+        history = np.roll(self._history, -(self._steps % (2 * self.window)),
+                          axis=1)
+        before, latest = history[:, :self.window], history[:, self.window:]
+        if self.mode == 'steady':
+            change = np.abs(latest.mean(1) - before.mean(1))
+            size = np.abs(latest.mean(1))
+        else:
+            change = np.sqrt(np.mean((latest - before) ** 2, axis=1))
+            size = np.sqrt(np.mean(latest ** 2, axis=1))
+        limit = np.maximum(self.tolerance * size, self.absolute_tolerance)
+        if np.all(change <= limit):
+            self.reason = self.mode
+            self.timestep = int(self.sarc.current_timestep)
+            self.change = dict(zip(self.metrics, change.tolist()))
+            return True
+        return False
+
+    def record(self):
+        """Why and when the run stopped, for the data file
+
+        Returns:
+            record: dict of the reason, "steady", "periodic", or
+                "timestep_number" if the run went to its end, the timestep
+                it stopped after, and the change in each watched metric
+                over the final windows, None if it ran to the end
+        """
+        return {'reason': self.reason or 'timestep_number',
+                'timestep': self.timestep if self.reason else
+                int(self.sarc.current_timestep),
+                'change': self.change,
+                'metrics': self.metrics,
+                'mode': self.mode}
+
+
 # ## File management
 class sarc_file:
     def __init__(self, sarc, meta, working_dir):
@@ -270,90 +496,201 @@ class sarc_file:
         os.remove(self.zip_filename)
 
 
+class trajectory_file:
+    def __init__(self, sarc, meta, working_dir, keyframe_every=100):
+        """Handles recording the sarcomere state to a compressed trajectory at
+        each timestep, see utilities.trajectory"""
+        self.working_filename = working_dir + '/' + meta['name'] + '.trajectory.gz'
+        self.writer = trajectory.writer(self.working_filename, sarc, keyframe_every)
+        self.append()
+
+    def append(self):
+        """Add the current timestep sarcomere to the trajectory"""
+        self.writer.append()
+
+    def finalize(self):
+        """Close the trajectory, it is already compressed"""
+        self.writer.close()
+        return self.working_filename
+
+    def delete(self):
+        """Delete the trajectory file from disk"""
+        os.remove(self.working_filename)
+
+
 class data_file:
-    def __init__(self, sarc, meta, working_dir):
-        """Generate the dictionary for use with the below data callback"""
+    # Values recorded at each timestep, float64 unless listed in DTYPES
+    COLUMNS = ('timestep', 'z_line', 'lattice_spacing', 'axial_force',
+               'radial_force_y', 'radial_force_z', 'radial_tension',
+               'xb_fraction_free', 'xb_fraction_loose', 'xb_fraction_tight',
+               'xb_trans_12', 'xb_trans_23', 'xb_trans_31', 'xb_trans_21',
+               'xb_trans_32', 'xb_trans_13', 'xb_trans_static',
+               'actin_permissiveness', 'thick_displace_mean',
+               'thick_displace_max', 'thick_displace_min',
+               'thick_displace_std', 'thin_displace_mean',
+               'thin_displace_max', 'thin_displace_min', 'thin_displace_std')
+    DTYPES = {'timestep': 'i8', 'xb_trans_12': 'i8', 'xb_trans_23': 'i8',
+              'xb_trans_31': 'i8', 'xb_trans_21': 'i8', 'xb_trans_32': 'i8',
+              'xb_trans_13': 'i8', 'xb_trans_static': 'i8'}
+
+    def __init__(self, sarc, meta, working_dir, chunk_size=100):
+        """Generate the columns files for use with the below data callback
+
+        What is recorded, and how often, follows the meta's 'recording'
+        plan, see parse_recording, or is every one of COLUMNS at every
+        timestep if the meta has none. Values recorded at each timestep are
+        appended to name.data.columns and those recorded every Nth to
+        name.data.everyN.columns, a chunk of chunk_size rows at a time, see
+        utilities.columns. All are exported to the familiar name.data.json
+        by finalize.
+        """
         self.sarc = sarc
         self.meta = meta
         self.working_directory = working_dir
         self.working_filename = None
-        self.data_dict = {
-            'name': self.meta['name'],
-            'timestep_length': self.sarc.timestep_len,
-            'timestep': [],
-            'z_line': [],
-            'lattice_spacing': [],
-            'axial_force': [],
-            'radial_force_y': [],
-            'radial_force_z': [],
-            'radial_tension': [],
-            'xb_fraction_free': [],
-            'xb_fraction_loose': [],
-            'xb_fraction_tight': [],
-            'xb_trans_12': [],
-            'xb_trans_23': [],
-            'xb_trans_31': [],
-            'xb_trans_21': [],
-            'xb_trans_32': [],
-            'xb_trans_13': [],
-            'xb_trans_static': [],
-            'actin_permissiveness': [],
-            'thick_displace_mean': [],
-            'thick_displace_max': [],
-            'thick_displace_min': [],
-            'thick_displace_std': [],
-            'thin_displace_mean': [],
-            'thin_displace_max': [],
-            'thin_displace_min': [],
-            'thin_displace_std': [],
-        }
+        self.recording = self.parse_recording(meta.get('recording'))
+        attributes = {'name': self.meta['name'],
+                      'timestep_length': self.sarc.timestep_len}
+        # ## One group of columns, in its own file, for each interval
+        self._groups = []
+        for every in sorted(set([entry['every'] for kind in self.recording
+                                 for entry in self.recording[kind].values()])):
+            group = {'every': every, 'metrics': [], 'profiles': [],
+                     'averaged': [], 'dtypes': {'timestep': 'i8'}}
+            for kind in ('metrics', 'profiles'):
+                for name, entry in self.recording[kind].items():
+                    if entry['every'] != every or name == 'timestep':
+                        continue
+                    group[kind].append(name)
+                    group['dtypes'][name] = self._dtype(kind, name,
+                                                        entry['average'])
+                    if entry['average']:
+                        group['averaged'].append(name)
+            suffix = '.data.columns' if every == 1 else \
+                '.data.every%i.columns' % every
+            group['columns'] = columns.writer(
+                self.working_directory + '/' + self.meta['name'] + suffix,
+                ['timestep'] + group['metrics'] + group['profiles'],
+                group['dtypes'], chunk_size,
+                attributes=dict(attributes, every=every))
+            self._groups.append(group)
+        self.columns_filenames = [group['columns'].filename
+                                  for group in self._groups]
+        # Running sums of the averaged values, and the steps appended
+        self._sums = {}
+        self._appended = 0
+        # Why and when the run stopped, if it was watched, see termination
+        self.termination = None
+
+    @classmethod
+    def parse_recording(cls, recording):
+        """Fill out a recording plan, checking what it asks for exists
+
+        Parameters:
+            recording: dict of 'metrics', hs.hs.METRICS to record, and
+                'profiles', hs.hs.PROFILES to record, each given either as
+                a list of names, recorded every timestep, or as a dict
+                whose values give by name either the interval in timesteps
+                as an int or a dict of 'every', the interval, and
+                'average', whether to record the mean over the interval
+                rather than a sample at its end. Recording every one of
+                COLUMNS each timestep if None; 'metrics' left out records
+                the same, 'profiles' left out records none.
+        Returns:
+            recording: dict of 'metrics' and 'profiles', each a dict by name
+                of dicts of 'every' and 'average'
+        """
+        if recording is None:
+            recording = {}
+        parsed = {}
+        for kind, known, default in (
+                ('metrics', hs.hs.METRICS, cls.COLUMNS),
+                ('profiles', hs.hs.PROFILES, ())):
+            plan = recording.get(kind, default)
+            if not isinstance(plan, dict):
+                plan = dict.fromkeys(plan, 1)
+            parsed[kind] = {}
+            for name, entry in plan.items():
+                if name not in known:
+                    raise ValueError("Unknown %s to record: %s" % (kind, name))
+                if not isinstance(entry, dict):
+                    entry = {'every': entry}
+                entry = {'every': int(entry.get('every', 1)),
+                         'average': bool(entry.get('average', False))}
+                if entry['every'] < 1:
+                    raise ValueError("Recording interval of %s must be at "
+                                     "least one timestep" % name)
+                parsed[kind][name] = entry
+        return parsed
+
+    def _dtype(self, kind, name, average):
+        """The column dtype of a metric or profile, float64 if averaged"""
+        if kind == 'metrics':
+            return 'f8' if average else self.DTYPES.get(name, 'f8')
+        sample = self.sarc.profile(name)
+        return ('f8' if average else sample.dtype.str, sample.shape)
+
+    @property
+    def data_dict(self):
+        """The values recorded so far, as a dict of name, timestep_length,
+        and a list of each column's values, with the timesteps of each
+        interval other than one as timestep_everyN, the recording plan
+        if the meta gave one, and the termination record if the run was
+        watched for one"""
+        data_dict = {'name': self.meta['name'],
+                     'timestep_length': self.sarc.timestep_len}
+        if self.meta.get('recording') is not None:
+            data_dict['recording'] = self.recording
+        if self.termination is not None:
+            data_dict['termination'] = self.termination
+        for group in self._groups:
+            for name, values in group['columns'].read().items():
+                if name == 'timestep' and group['every'] != 1:
+                    name = 'timestep_every%i' % group['every']
+                data_dict[name] = values.tolist()
+        return data_dict
 
     def append(self):
-        """Digest out the non-vector values we want to record for each
-        timestep and append them to the data_dict. This is called at each
-        timestep to build a dict for inclusion in a pandas DataFrame.
+        """Digest out the values we want to record for this timestep and
+        append them to the columns of each interval that ends with it. This
+        is called at each timestep to build a table for inclusion in a
+        pandas DataFrame.
+
+        Only the values recorded this timestep, or averaged over an
+        interval, are found, so that costly ones recorded rarely are rarely
+        paid for.
         """
-        # ## Lambda helpers
-        ad = lambda n, v: self.data_dict[n].append(v)
-        # ## Calculated components
-        radial_force = self.sarc.radial_force()
-        xb_fracs = self.sarc.get_frac_in_states()
-        xb_trans = sum(sum(self.sarc.last_transitions, []), [])
-        act_perm = np.mean(self.sarc.actin_permissiveness)
-        thick_d = np.hstack([t.displacement_per_crown()
-                             for t in self.sarc.thick])
-        thin_d = np.hstack([t.displacement_per_node()
-                            for t in self.sarc.thin])
-        # ## Dictionary work
-        ad('timestep', self.sarc.current_timestep)
-        ad('z_line', self.sarc.z_line)
-        ad('lattice_spacing', self.sarc.lattice_spacing)
-        ad('axial_force', self.sarc.axial_force())
-        ad('radial_force_y', radial_force[0])
-        ad('radial_force_z', radial_force[1])
-        ad('radial_tension', self.sarc.radial_tension())
-        ad('xb_fraction_free', xb_fracs[0])
-        ad('xb_fraction_loose', xb_fracs[1])
-        ad('xb_fraction_tight', xb_fracs[2])
-        ad('xb_trans_12', xb_trans.count('12'))
-        ad('xb_trans_23', xb_trans.count('23'))
-        ad('xb_trans_31', xb_trans.count('31'))
-        ad('xb_trans_21', xb_trans.count('21'))
-        ad('xb_trans_32', xb_trans.count('32'))
-        ad('xb_trans_13', xb_trans.count('13'))
-        ad('xb_trans_static', xb_trans.count(None))
-        ad('actin_permissiveness', act_perm)
-        ad('thick_displace_mean', np.mean(thick_d))
-        ad('thick_displace_max', np.max(thick_d))
-        ad('thick_displace_min', np.min(thick_d))
-        ad('thick_displace_std', np.std(thick_d))
-        ad('thin_displace_mean', np.mean(thin_d))
-        ad('thin_displace_max', np.max(thin_d))
-        ad('thin_displace_min', np.min(thin_d))
-        ad('thin_displace_std', np.std(thin_d))
+        self._appended += 1
+        due = [group for group in self._groups
+               if self._appended % group['every'] == 0]
+        names = {'metrics': {'timestep'}, 'profiles': set()}
+        for group in self._groups:
+            for kind in names:
+                if group in due:
+                    names[kind].update(group[kind])
+                else:
+                    names[kind].update(set(group[kind]) &
+                                       set(group['averaged']))
+        values = self.sarc.metrics(sorted(names['metrics']))
+        for name in names['profiles']:
+            values[name] = self.sarc.profile(name)
+        for group in self._groups:
+            for name in group['averaged']:
+                self._sums[name] = self._sums.get(name, 0) + values[name]
+        for group in due:
+            row = values.copy()
+            for name in group['averaged']:
+                row[name] = self._sums.pop(name) / group['every']
+            group['columns'].append(row)
+
+    def flush(self):
+        """Append the timesteps recorded so far to the columns files, so a
+        live reader sees them"""
+        for group in self._groups:
+            group['columns'].flush()
 
     def finalize(self):
-        """Write the data dict to the temporary file location"""
+        """Write the data dict to the temporary file location as JSON"""
         data_name = '/' + self.meta['name'] + '.data.json'
         self.working_filename = self.working_directory + data_name
         with open(self.working_filename, 'w') as datafile:
@@ -361,24 +698,31 @@ class data_file:
         return self.working_filename
 
     def delete(self):
-        """Delete the data file from disk"""
-        try:
-            os.remove(self.working_filename)
-        except FileNotFoundError:
-            print("File not created yet")
+        """Delete the data files from disk"""
+        for filename in [self.working_filename] + self.columns_filenames:
+            try:
+                os.remove(filename)
+            except (FileNotFoundError, TypeError):
+                print("File not created yet")
 
 
 class s3:
     def __init__(self):
-        """Provide an interface to to S3 that hides some error handling"""
+        """Provide an interface to to S3 that hides some error handling
+
+        boto is imported where it is used, rather than with the module, so
+        that local runs never pay for loading it.
+        """
         self._refresh_s3_connection()
 
     def _refresh_s3_connection(self):
         """Reconnect to s3, the connection gets dropped sometimes"""
+        import boto
         self.s3 = boto.connect_s3()
 
     def _get_bucket(self, bucket_name):
         """Return link to a bucket name"""
+        import boto.exception
         try:
             bucket = self.s3.get_bucket(bucket_name)
         except (boto.exception.BotoClientError,
@@ -476,8 +820,13 @@ class s3:
         #       that allows them to switch between two things quickly enough that they get very close
         #       to executing two processes at once.
         #   This means that a 4 core cpu with hyper-threading can have 8 things going on at the same time.
+        #   Rather than a process per meta file, a fixed pool of worker processes is handed runs from a
+        #       queue one at a time, each down its own pipe, so that any number of meta files can be
+        #       worked through on one machine.
 
-        def __init__(self, meta_files, unattended=True, use_sarc=True, force=False, live_update=None):
+        def __init__(self, meta_files, unattended=True, use_sarc=True, force=False, live_update=None,
+                     seed=None, instrumented=False, workers=None, timeout=None, retries=0,
+                     result_cache=None):
             """Create a managed batch of instances of sarc objects, optionally running them
 
             Parameters
@@ -489,20 +838,35 @@ class s3:
             unattended: boolean
                 Whether to complete the run without further intervention or treat
                 as an interactive session.
+            force: boolean
+                No longer needed, every meta file is run however many there are.
+            seed: int, optional
+                Seed from which each run is given its own independent stream,
+                overriding the meta files' seeds. Runs seeded from their meta
+                files, or from the OS, if not given.
+            instrumented: boolean
+                Whether each run records and saves its timings and counts, see
+                manage.
+            workers: int, optional
+                Number of runs worked on at once, 75% of the available threads
+                (and at least 2) if not given.
+            timeout: float, optional
+                Seconds a run may take before its worker is stopped and the run
+                counted as failed. Runs are not timed out if not given.
+            retries: int
+                Times a failed or timed out run is tried again, with the same
+                seed, before it is given up on (0).
+            result_cache: string or utilities.cache.result_cache, optional
+                Store of results shared by the runs, see manage.
             """
-            max_threads = max(2, int(0.75 * mp.cpu_count()))
-            if len(meta_files) >= mp.cpu_count():
-                print("More instances than threads,", end=" ")
-                if not force:
-                    print("these files will not be run:")
-                    for meta_file in meta_files[max_threads:]:
-                        print(meta_file)
-                    meta_files = meta_files[0:max_threads]
-                else:
-                    print("forcing anyway."
-                          "\nBehavior will be dependent on python's built in class multiprocessing.")
-            elif len(meta_files) > max_threads:
-                print("More that 75% of available threads will be used for simulations, proceeding anyway.")
+            if workers is None:
+                workers = max(2, int(0.75 * mp.cpu_count()))
+            self.workers = min(workers, len(meta_files))
+            self.use_sarc = use_sarc
+            self.instrumented = instrumented
+            self.timeout = timeout
+            self.retries = retries
+            self.result_cache = result_cache
 
             live_update_list = []
             if isinstance(live_update, list):
@@ -511,15 +875,22 @@ class s3:
                 live_update_list.append(live_update)
             while len(live_update_list) < len(meta_files):
                 live_update_list.append(None)
-            print(live_update_list)
 
-            self.managers = []
-            for meta_file, live_update in zip(meta_files, live_update_list):
-                self.managers.append(manage(meta_file, unattended, use_sarc, live_update))
+            seeds = [None for _ in meta_files]
+            if seed is not None:
+                seeds = np.random.SeedSequence(seed).spawn(len(meta_files))
 
-            self.processes = []
-            for manager in self.managers:
-                self.processes.append(mp.Process(target=manager.run_and_save, args=()))
+            # The sarcomeres are built by the workers, only the description
+            # of each run is kept here
+            self.jobs = []
+            for index, (meta_file, live_update, run_seed) in enumerate(
+                    zip(meta_files, live_update_list, seeds)):
+                self.jobs.append({'index': index, 'meta_file': meta_file,
+                                  'live_update': live_update, 'seed': run_seed,
+                                  'status': 'queued', 'attempts': 0,
+                                  'exitcode': None, 'seconds': None,
+                                  'error': None})
+            self.summary = None
 
             if unattended:
                 try:
@@ -528,14 +899,178 @@ class s3:
                     mp.current_process().terminate()
                     print(e)
 
+        @staticmethod
+        def _work(connection, use_sarc, instrumented, result_cache):
+            """Worker loop: run each job sent down the connection until a None
+
+            Each job's attempt id is sent back with its exitcode, seconds
+            taken, and any error once it ends.
+            """
+            for job in iter(connection.recv, None):
+                tic = time.time()
+                error = None
+                try:
+                    manager = manage(job['meta_file'], False, use_sarc, job['live_update'],
+                                     job['seed'], instrumented, result_cache)
+                    _, exitcode = manager.run_and_save()
+                except Exception as e:
+                    exitcode = 1
+                    error = repr(e)
+                connection.send({'attempt': job['attempt'], 'exitcode': exitcode,
+                                 'seconds': time.time() - tic, 'error': error})
+
+        def _start_worker(self, worker_id):
+            """Start, or restart, the worker process of a given id
+
+            Each worker has a pipe of its own, so that stopping one can only
+            ever break the pipe that is thrown away with it.
+            """
+            connection, worker_connection = mp.Pipe()
+            process = mp.Process(target=self._work, name="worker-%i" % worker_id,
+                                 args=(worker_connection, self.use_sarc, self.instrumented,
+                                       self.result_cache))
+            process.start()
+            worker_connection.close()
+            self._workers[worker_id] = (process, connection)
+
+        def _dispatch(self, worker_id, job):
+            """Send a job to an idle worker, tracking it as running from now"""
+            self._attempts += 1
+            job.update(status='running', attempts=job['attempts'] + 1)
+            description = {key: job[key] for key in ('meta_file', 'live_update', 'seed')}
+            description['attempt'] = self._attempts
+            self._workers[worker_id][1].send(description)
+            self._running[worker_id] = (job, self._attempts, time.time())
+
+        def _finish_job(self, job, status, exitcode=None, seconds=None, error=None):
+            """Record how a job attempt ended and queue it again if it may be
+            retried, returning whether the job is now done with"""
+            job.update(status=status, exitcode=exitcode, seconds=seconds, error=error)
+            if status != 'done' and job['attempts'] <= self.retries:
+                job['status'] = 'retrying'
+                self._pending.append(job)
+                return False
+            return True
+
+        def _report(self, job, finished, start):
+            """Print a line on how a job ended and how the batch is going"""
+            counts = {status: 0 for status in ('done', 'failed', 'timeout', 'running')}
+            for each in self.jobs:
+                if each['status'] in counts:
+                    counts[each['status']] += 1
+            sec_passed = time.time() - start
+            sec_left = int(sec_passed / finished * (len(self.jobs) - finished))
+            print("[%i/%i] %s %s; %i done, %i failed, %i timed out, %i running, %ih%im%is left" % (
+                finished, len(self.jobs), job['status'], os.path.basename(job['meta_file']),
+                counts['done'], counts['failed'], counts['timeout'], counts['running'],
+                sec_left / 60 / 60, sec_left / 60 % 60, sec_left % 60))
+            sys.stdout.flush()
+
+        def _check_worker(self, worker_id):
+            """See how the job a worker holds is going
+
+            Returns
+            -------
+            ended: tuple or None
+                The job, its status, exitcode, seconds, and any error if its
+                attempt has ended, None if it is still going
+            """
+            job, attempt, tic = self._running[worker_id]
+            process, connection = self._workers[worker_id]
+            # A finished run's reply is taken before anything else is
+            # decided, so a run done just as it timed out counts as done
+            while connection.poll():
+                try:
+                    reply = connection.recv()
+                except EOFError:
+                    break  # the worker died, see below
+                if reply['attempt'] != attempt:
+                    continue  # from an attempt already closed
+                status = 'done' if reply['exitcode'] == 0 else 'failed'
+                return job, status, reply['exitcode'], reply['seconds'], reply['error']
+            timed_out = self.timeout is not None and time.time() - tic > self.timeout
+            if process.is_alive() and not timed_out:
+                return None
+            # The worker is stopped while it holds the job, so inside manage
+            # and using no pipe but its own, which is replaced with it
+            if timed_out:
+                process.terminate()
+            process.join()
+            # Clear away what the stopped run left in its working dir
+            shutil.rmtree(manage.working_dir_name(job['meta_file']), ignore_errors=True)
+            if timed_out:
+                status, error = 'timeout', "took more than %s s" % self.timeout
+            else:
+                status, error = 'failed', "worker exited with code %s" % process.exitcode
+            self._start_worker(worker_id)
+            return job, status, process.exitcode, time.time() - tic, error
+
         def run_and_save(self):
+            """Work through every job with the pool of workers
+
+            Returns
+            -------
+            summary: dict
+                Counts of runs done, failed, timed out, and retried, the seconds
+                taken, and the status, exitcode, attempts, seconds, and any
+                error of each job
+            exitcode: int
+                0 if every run finished, 1 otherwise
+            """
             start = time.time()
-            for process in self.processes:
-                process.start()
-            for process in self.processes:
-                process.join()
+            self._workers = {}  # worker id: (process, connection)
+            self._running = {}  # worker id: (job, attempt id, dispatch time)
+            self._pending = collections.deque(self.jobs)
+            self._attempts = 0
+            for worker_id in range(self.workers):
+                self._start_worker(worker_id)
+
+            finished = 0
+            while finished < len(self.jobs):
+                for worker_id in list(self._workers):
+                    if worker_id not in self._running and self._pending:
+                        if not self._workers[worker_id][0].is_alive():
+                            self._workers[worker_id][0].join()
+                            self._start_worker(worker_id)  # died while idle
+                        self._dispatch(worker_id, self._pending.popleft())
+                # Wait for a reply or a worker's death, or to check the timeouts
+                waiting = []
+                for worker_id in self._running:
+                    process, connection = self._workers[worker_id]
+                    waiting += [connection, process.sentinel]
+                wait = 1
+                if self.timeout is not None and self._running:
+                    first = min([tic for _, _, tic in self._running.values()])
+                    wait = min(wait, max(0, first + self.timeout - time.time()))
+                mp.connection.wait(waiting, timeout=wait)
+                for worker_id in list(self._running):
+                    ended = self._check_worker(worker_id)
+                    if ended is None:
+                        continue
+                    del self._running[worker_id]
+                    job = ended[0]
+                    if self._finish_job(*ended):
+                        finished += 1
+                        self._report(job, finished, start)
 
-            end = time.time()
-            print(end - start, "seconds")
+            for process, connection in self._workers.values():
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass  # the worker died while idle, join it below
+            for process, connection in self._workers.values():
+                process.join()
+                connection.close()
 
-            return None, 0
+            self.summary = {status: sum([job['status'] == status for job in self.jobs])
+                            for status in ('done', 'failed', 'timeout')}
+            self.summary['retried'] = sum([job['attempts'] > 1 for job in self.jobs])
+            self.summary['seconds'] = time.time() - start
+            self.summary['jobs'] = [
+                {key: job[key] for key in ('meta_file', 'status', 'exitcode', 'attempts',
+                                           'seconds', 'error')}
+                for job in self.jobs]
+            print("%i done, %i failed, %i timed out, %i retried, in %.1f seconds" % (
+                self.summary['done'], self.summary['failed'], self.summary['timeout'],
+                self.summary['retried'], self.summary['seconds']))
+            return self.summary, 0 if self.summary['done'] == len(self.jobs) else 1
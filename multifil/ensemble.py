@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+ensemble.py - many replicate half-sarcomeres, run in lockstep
+
+Replicates of a run differ only in their random draws, so rather than
+running each through its own interpreter an ensemble holds them side by
+side. The lattice state arrays of every replicate are stacked, filament
+rows over filament rows, and each replicate's hs views its own block. The
+binding site search and the force balance are then found for the whole
+ensemble at once, while each replicate remains a full hs that can be
+inspected, recorded, or written out as usual. Each replicate draws its
+kinetics from its own random stream, so it runs exactly as an hs created
+with the same seed and starts would on its own.
+
+Example
+--------
+>>> from multifil import ensemble
+>>> ens = ensemble.ensemble(8, z_line=1250)
+>>> record = ens.run(100)
+>>> ensemble.aggregate(record)['axial_force_mean']
+array([...])
+"""
+
+import numpy as np
+
+from multifil import hs
+from multifil import mh
+
+
+class ensemble:
+    """A set of half-sarcomeres sharing a protocol, advanced together"""
+
+    # The hs array kernels work over rows of filaments and flat indices into
+    # them, so they serve the stacked replicates unchanged
+    _bound = hs.hs._bound
+    _bound_separations = hs.hs._bound_separations
+    _xb_axial_forces = hs.hs._xb_axial_forces
+    _thick_node_forces = hs.hs._thick_node_forces
+    _thin_node_forces = hs.hs._thin_node_forces
+
+    def __init__(self, replicates, starts=None, seed=None, **kwargs):
+        """Create the replicate half-sarcomeres and stack their state
+
+        Parameters:
+            replicates: how many half-sarcomeres to run
+            starts: optional list, one entry per replicate, of the starts
+                each is created with, see hs.hs; random if not given
+            seed: int seed of the ensemble, from which each replicate
+                gets an independent stream, see hs.hs; from the OS if not
+                given
+            **kwargs: further keyword arguments, such as z_line,
+                time_dependence, rate_tolerance, or predictor, are passed
+                to every hs.hs on creation. Only the numpy backend is
+                supported and instruments can't be given
+        Returns:
+            None
+
+        The replicates share the protocol, so z_line and lattice_spacing
+        are read from the first of them. Replicates may have different
+        starts but must have the same number of binding sites on each
+        thin face, as the default lattice does.
+        """
+        if starts is None:
+            starts = [None] * replicates
+        assert len(starts) == replicates, "need starts for each replicate"
+        if kwargs.get('backend', "numpy") != "numpy":
+            raise ValueError("Ensembles only support the numpy backend")
+        if kwargs.get('instruments') is not None:
+            raise ValueError("Ensembles can't be instrumented")
+        seeds = np.random.SeedSequence(seed).spawn(replicates)
+        self.replicates = tuple([hs.hs(starts=start, seed=child, **kwargs)
+                                 for start, child in zip(starts, seeds)])
+        self.solver = self.replicates[0].solver
+        # Stack each lattice state array, then point the replicates at their
+        # own block of the stack
+        for name in ('thick_axial', 'thin_axial', 'xb_state', 'bs_bound',
+                     'bs_permissiveness'):
+            setattr(self, name, self._stack(name))
+        self._xb_bound = self._stack('xb_bound')
+        self._bound_pairs = None  # found on demand, see hs._bound
+        # Offsets that turn a replicate's flat indices into the ensemble's
+        n_xb = self.replicates[0].xb_state.size
+        n_bs = self.replicates[0].bs_bound.size
+        n_nodes = self.replicates[0].thick_axial.size
+        n_faces = len(self.replicates[0]._thin_faces)
+        which = np.arange(replicates)
+        self._xb_replicate = np.repeat(which, n_xb)
+        self._xb_offset = self._xb_replicate * n_xb
+        self._bs_offset = self._xb_replicate * n_bs
+        self._xb_node = np.hstack([rep._xb_node for rep in self.replicates]) \
+            + self._xb_replicate * n_nodes
+        self._xb_thin_face = np.hstack(
+            [rep._xb_thin_face for rep in self.replicates]) + \
+            self._xb_replicate * n_faces
+        self._face_sites = np.vstack(
+            [[face._site_flat + i * n_bs for face in rep._thin_faces]
+             for i, rep in enumerate(self.replicates)])
+        # Head parameters are shared, the first head speaks for them all
+        self._crossbridges = self.replicates[0]._crossbridges[:1]
+
+    def _stack(self, name):
+        """Stack a lattice state array, making each replicate's a view"""
+        stack = np.concatenate([getattr(rep, name) for rep in
+                                self.replicates])
+        for rep, block in zip(self.replicates,
+                              np.split(stack, len(self.replicates))):
+            setattr(rep, name, block)
+        return stack
+
+    def __len__(self):
+        return len(self.replicates)
+
+    @property
+    def xb_bound(self):
+        """Ensemble flat index of the site each head is bound to, or -1"""
+        return np.where(self._xb_bound >= 0,
+                        self._xb_bound + self._bs_offset, -1)
+
+    @property
+    def z_line(self):
+        """Axial location of the z-line, shared by the replicates"""
+        return self.replicates[0].z_line
+
+    @property
+    def lattice_spacing(self):
+        """Lattice spacing seen by each cross-bridge of the ensemble"""
+        return np.array([rep.lattice_spacing for rep in self.replicates]
+                        )[self._xb_replicate]
+
+    @property
+    def current_timestep(self):
+        """Return the current timestep"""
+        return self.replicates[0].current_timestep
+
+    def timestep(self, current=None):
+        """Move every replicate one step forward in time together"""
+        if current is None:
+            current = self.current_timestep + 1
+        for rep in self.replicates:
+            rep.current_timestep = current
+        transitions = self.transition()
+        for rep, trans in zip(self.replicates, transitions):
+            rep.last_transitions = trans
+            rep._predict()
+        self.settle()
+        for rep in self.replicates:
+            if rep.predictor is not None:
+                rep._settled_z_line = rep.z_line
+
+    def transition(self):
+        """Give every cross-bridge of every replicate a chance to transition
+
+        This is hs.transition over the whole ensemble, the rules for
+        binding conflicts apply within each replicate as there. Sites are
+        found for every replicate at once, then each replicate's rates are
+        checked against draws from its own stream.
+
+        Returns:
+            transitions: for each replicate, the transitions nested by
+                thick filament and crown as hs.transition gives them
+        """
+        head = self._crossbridges[0]
+        site = self.xb_bound
+        base = self.thick_axial.flat[self._xb_node]
+        free = np.flatnonzero(site < 0)
+        site[free] = self._nearest_sites(free, base[free])
+        axial_sep = self.thin_axial.flat[site] - base
+        actin_state = self.bs_permissiveness.flat[site]
+        table = None
+        if self.replicates[0].rate_tolerance is not None:
+            table = head.rate_table(self.replicates[0].rate_tolerance)
+        n = len(self)
+        codes = np.concatenate([
+            head.batch_transition((sep, rep.lattice_spacing), ap, state,
+                                  table, rep.rng)
+            for rep, sep, ap, state in zip(
+                self.replicates, np.split(axial_sep, n),
+                np.split(actin_state, n), np.split(self.xb_state, n))])
+        # Unbind, from either the loose or the tight state
+        unbinding = (codes == 2) | (codes == 5)
+        self.bs_bound[site[unbinding]] = -1
+        self._xb_bound[unbinding] = -1
+        self.xb_state[unbinding] = 0
+        # Power stroke and its reverse
+        self.xb_state[codes == 3] = 2
+        self.xb_state[codes == 4] = 1
+        # Bind, where the site is open and not sought by an earlier head,
+        # sites are distinct across replicates so one pass serves them all
+        binding = np.flatnonzero(codes == 1)
+        sought, first = np.unique(site[binding], return_index=True)
+        binding = binding[first[self.bs_bound[sought] < 0]]
+        self._xb_bound[binding] = site[binding] - self._bs_offset[binding]
+        self.bs_bound[site[binding]] = binding - self._xb_offset[binding]
+        self.xb_state[binding] = 1
+        # Bound pairs are found afresh, here and in each replicate
+        self._bound_pairs = None
+        for rep in self.replicates:
+            rep._bound_pairs = None
+        # Report transitions per replicate as hs.transition would
+        for rep, rep_codes in zip(self.replicates, np.split(codes, len(self))):
+            rep._transition_codes = rep_codes
+        names = np.split(np.array(mh.TRANSITIONS, dtype=object)[codes],
+                         len(self))
+        return [name[rep._xb_by_crown].tolist() for name, rep in
+                zip(names, self.replicates)]
+
+    def _nearest_sites(self, heads, axial_locations):
+        """Nearest binding site to each head on its opposing thin face
+
+        This is ThinFace.nearest_index for every face of every replicate at
+        once. With few sites per face, counting the sites below each
+        location is as quick as a search and needs no loop over faces.
+
+        Parameters:
+            heads: ensemble flat indices of the heads looking for sites
+            axial_locations: axial location of each of those heads
+        Return:
+            sites: ensemble flat index of the nearest site to each head
+        """
+        hiding_lines = np.array([rep.hiding_line for rep in self.replicates])
+        axial_locations = np.maximum(
+            hiding_lines[self._xb_replicate[heads]], axial_locations)
+        face_sites = self._face_sites[self._xb_thin_face[heads]]
+        face_locs = self.thin_axial.flat[face_sites]
+        rows = np.arange(len(heads))
+        next_index = np.sum(face_locs < axial_locations[:, None], axis=1)
+        prev_index = next_index - 1
+        # At a very short SL the end face loc is closest, return the end
+        at_end = next_index == face_locs.shape[1]
+        next_index[at_end] = prev_index[at_end]
+        # Otherwise if prior site was closer, give it, else give next
+        prev_closer = \
+            np.abs(face_locs[rows, prev_index] - axial_locations) < \
+            np.abs(face_locs[rows, next_index] - axial_locations)
+        nearest = np.where(prev_closer | at_end, prev_index, next_index)
+        return face_sites[rows, nearest]
+
+    def _filament_constants(self):
+        """Stiffness and rest spacings of every replicate's filaments
+
+        Returns:
+            (thick_k, thick_rests, thin_k, thin_rests): as
+                hs._filament_constants, stacked over the replicates
+        """
+        each = [rep._filament_constants() for rep in self.replicates]
+        return tuple([np.vstack(c) for c in zip(*each)])
+
+    def settle(self, solver=None):
+        """Balance the forces in every replicate
+
+        Relaxation sweeps are taken for the whole ensemble together. Each
+        replicate stops moving once it meets the convergence limit of
+        hs.settle, so it ends where it would have if run on its own. Other
+        solvers settle each replicate in turn. Each replicate's sweeps or
+        steps are recorded in its last_settle_iterations.
+
+        Parameters:
+            solver: overrides the solver chosen on creation for this call
+        """
+        converge_limit = 0.12  # see hs.settle
+        if solver is None:
+            solver = self.solver
+        if solver != "relax":
+            for rep in self.replicates:
+                rep.last_settle_iterations = rep.settle(solver)
+            return
+        constants = self._filament_constants()
+        active = np.ones(len(self), dtype=bool)
+        iterations = np.zeros(len(self), dtype=int)
+        while active.any():
+            residual = self._single_settle(active, constants=constants)
+            iterations += active
+            active &= residual > converge_limit
+        for rep, sweeps in zip(self.replicates, iterations):
+            rep.last_settle_iterations = int(sweeps)
+
+    def _single_settle(self, active, factor=0.95, constants=None):
+        """One relaxation sweep of the active replicates, as hs._single_settle
+
+        Parameters:
+            active: boolean array, which replicates should move
+        Returns:
+            residual: each replicate's largest force before the sweep
+        """
+        if constants is None:
+            constants = self._filament_constants()
+        thick_k, thick_rests, thin_k, thin_rests = constants
+        n = len(self)
+        # Thick filaments, the last node has a spring on only one side
+        thick = self._thick_node_forces(thick_k, thick_rests)
+        isolated = factor * thick / thick_k
+        isolated[:, -1] *= 2
+        moving = np.repeat(active, len(thick) // n)[:, None]
+        self.thick_axial += np.where(moving, np.cumsum(isolated, axis=1), 0)
+        # Thin filaments, the first node has a spring on only one side
+        thin = self._thin_node_forces(thin_k, thin_rests)
+        isolated = factor * thin / thin_k
+        isolated[:, 0] *= 2
+        moving = np.repeat(active, len(thin) // n)[:, None]
+        self.thin_axial += np.where(
+            moving, np.cumsum(isolated[:, ::-1], axis=1)[:, ::-1], 0)
+        return np.maximum(np.abs(thick).reshape(n, -1).max(axis=1),
+                          np.abs(thin).reshape(n, -1).max(axis=1))
+
+    def axial_force(self):
+        """Each replicate's axial force on the M-line, (replicates,) array"""
+        return np.array([rep.axial_force() for rep in self.replicates])
+
+    def get_frac_in_states(self):
+        """Fraction of each replicate's cross-bridges in each state
+
+        Returns:
+            fractions: (replicates, 3) array, free, loose, and tight
+        """
+        states = self.xb_state.reshape(len(self), -1).astype(np.intp)
+        counts = np.apply_along_axis(np.bincount, 1, states, minlength=3)
+        return counts / states.shape[1]
+
+    def run(self, timesteps):
+        """Advance the ensemble, recording each replicate at each step
+
+        Parameters:
+            timesteps: number of timesteps to run
+        Returns:
+            record: dict of timestep, z_line, and lattice_spacing, each a
+                (timesteps,) array, and of axial_force, xb_fraction_free,
+                xb_fraction_loose, and xb_fraction_tight, each a
+                (timesteps, replicates) array
+        """
+        record = {key: [] for key in (
+            'timestep', 'z_line', 'lattice_spacing', 'axial_force',
+            'xb_fraction_free', 'xb_fraction_loose', 'xb_fraction_tight')}
+        for _ in range(timesteps):
+            self.timestep()
+            fracs = self.get_frac_in_states()
+            record['timestep'].append(self.current_timestep)
+            record['z_line'].append(self.z_line)
+            record['lattice_spacing'].append(
+                self.replicates[0].lattice_spacing)
+            record['axial_force'].append(self.axial_force())
+            record['xb_fraction_free'].append(fracs[:, 0])
+            record['xb_fraction_loose'].append(fracs[:, 1])
+            record['xb_fraction_tight'].append(fracs[:, 2])
+        return {key: np.array(value) for key, value in record.items()}
+
+
+def aggregate(record):
+    """Summarize an ensemble record across its replicates
+
+    Parameters:
+        record: dict as returned by ensemble.run
+    Returns:
+        summary: for each per-replicate entry of the record, its mean and
+            standard deviation across replicates at each timestep, under
+            the entry's name suffixed with _mean and _std. Entries shared
+            by the replicates are passed through.
+    """
+    summary = {}
+    for key, value in record.items():
+        if value.ndim == 2:
+            summary[key + '_mean'] = value.mean(axis=1)
+            summary[key + '_std'] = value.std(axis=1)
+        else:
+            summary[key] = value
+    return summary
@@ -9,10 +9,13 @@ Created by Dave Williams on 2009-12-31.
 import sys
 import multiprocessing as mp
 import time
+import functools
 import numpy as np
 
 from multifil import af
 from multifil import mf
+from multifil import mh
+from multifil.utilities import json
 
 
 class hs:
@@ -20,7 +23,9 @@ class hs:
 
     def __init__(self, lattice_spacing=None, z_line=None, poisson=None,
                  actin_permissiveness=None, timestep_len=1,
-                 time_dependence=None, starts=None):
+                 time_dependence=None, starts=None, solver=None,
+                 backend=None, rate_tolerance=None, seed=None,
+                 predictor=None, instruments=None):
         """ Create the data structure that is the half-sarcomere model
 
         Parameters:
@@ -44,6 +49,28 @@ class hs:
                     * "actin_permissiveness"
             starts: starting polymer/orientation for thin/thick filaments in
                 form ((rand(0,25), ...), (rand(0,3), ...))
+            solver: how settle balances forces after each timestep
+                    * "relax" - repeated relaxation sweeps, default value
+                    * "newton" - Newton iteration on the linearized lattice
+            backend: what computes the kinetics and the relaxation sweeps
+                    * "numpy" - array operations, default value
+                    * "numba" - compiled loops from multifil.jit, falling
+                      back to "numpy" with a warning if numba is missing
+            rate_tolerance: if given, the numpy backend finds the bound
+                cross-bridge rates from a table of their energies, see
+                mh.RateTable, interpolated to within this many pN nm of
+                the exact energies. Exact rates are found if None (default)
+            seed: seed of the random stream this half-sarcomere draws its
+                starts and kinetics from, an int or a numpy SeedSequence.
+                One is drawn from the OS if not given, see self.seed
+            predictor: how each timestep guesses where the filaments will
+                settle before relaxing them there
+                    * None - start from the current locations, default value
+                    * "shift" - move the thin filaments by the change in
+                      the z-line imposed by time_dependence since the last
+                      timestep settled
+            instruments: optional utilities.instrument.instruments, to
+                record the time and counts of each timestep in
         Returns:
             None
 
@@ -112,10 +139,32 @@ class hs:
             a single value, the spring constant of the thin filament between
             any given pair of thin binding sites
 
+        ## Lattice state arrays: the state of every structure is kept in
+        contiguous arrays owned by the half-sarcomere. The filaments, binding
+        sites, and cross-bridges are thin views onto these arrays.
+
+        thick_axial:
+            (4, 60) array of the axial locations of each thick filament node
+        thin_axial:
+            (8, 90) array of the axial locations of each thin filament node
+        xb_state:
+            (720,) array of the numeric state (0, 1, or 2) of each
+            cross-bridge, ordered by thick filament, face, and cross-bridge
+        xb_bound:
+            (720,) array of the flat binding site index (thin filament index
+            * 90 + node index) each cross-bridge is bound to, -1 if unbound
+        bs_bound:
+            (720,) array of the flat cross-bridge index each binding site is
+            bound to, -1 if unbound
+        bs_permissiveness:
+            (8, 90) array of the permissiveness of each binding site
+
         """
         # Versioning, to be updated when backwards incompatible changes to the
-        # data structure are made, not on release of new features
-        self.version = 1.2
+        # data structure are made, not on release of new features. 1.3 draws
+        # from a Generator per half-sarcomere, so a seed gives other results
+        # than it did in 1.2
+        self.version = 1.3
         # Parse initial LS and Z-line
         if time_dependence is not None:
             if 'lattice_spacing' in time_dependence:
@@ -132,6 +181,18 @@ class hs:
             z_line = 1250
         if poisson is None:
             poisson = 0.0
+        if solver is None:
+            solver = "relax"
+        self.solver = solver
+        if backend is None:
+            backend = "numpy"
+        self.backend = backend
+        self.rate_tolerance = rate_tolerance
+        if predictor not in (None, "shift"):
+            raise ValueError("Unknown predictor: %s" % predictor)
+        self.predictor = predictor
+        self._settled_z_line = None  # z-line at the last settle, see _predict
+        self.instruments = instruments
         # Record initial values for use with poisson driven ls
         self._initial_z_line = z_line
         self._initial_lattice_spacing = lattice_spacing
@@ -139,13 +200,32 @@ class hs:
         # Store these values for posterity
         self.lattice_spacing = lattice_spacing
         self.z_line = z_line
+        # Allocate the lattice state arrays that the structures below view
+        n_thick, n_crowns, n_thin, n_nodes = 4, 60, 8, 90
+        n_xb, n_bs = 3 * n_thick * n_crowns, n_thin * n_nodes
+        self.thick_axial = np.zeros((n_thick, n_crowns))
+        self.thin_axial = np.zeros((n_thin, n_nodes))
+        self.xb_state = np.zeros(n_xb, dtype=np.int8)
+        self.xb_bound = np.full(n_xb, -1, dtype=np.intp)
+        self._bound_pairs = None  # found on demand, see _bound
+        self._transition_codes = None  # of the last transition, see metrics
+        self.bs_bound = np.full(n_bs, -1, dtype=np.intp)
+        self.bs_permissiveness = np.ones((n_thin, n_nodes))
+        self._crossbridges = []  # by flat index, filled as they are created
+        self._binding_sites = []
         # Create the thin filaments, unlinked but oriented on creation.
         thin_orientations = ([4, 0, 2], [3, 5, 1], [4, 0, 2], [3, 5, 1],
                              [3, 5, 1], [4, 0, 2], [3, 5, 1], [4, 0, 2])
-        # noinspection PyArgumentList
-        np.random.seed()
+        # Each sarcomere owns its random stream. An unseeded one draws its
+        # seed from the OS, so that forked workers don't share a stream, and
+        # records it so the run can be repeated
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1, np.uint64)[0])
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
         if starts is None:
-            thin_starts = [np.random.randint(25) for _ in thin_orientations]
+            thin_starts = [int(self.rng.integers(25))
+                           for _ in thin_orientations]
         else:
             thin_starts = starts[0]
         self._thin_starts = thin_starts
@@ -181,7 +261,7 @@ class hs:
         # |         a4         |      m2         m2      m1  |
         # ----------------------------------------------------
         if starts is None:
-            thick_starts = [np.random.randint(1, 4) for _ in range(4)]
+            thick_starts = [int(self.rng.integers(1, 4)) for _ in range(4)]
         else:
             thick_starts = starts[1]
         self._thick_starts = thick_starts
@@ -238,6 +318,28 @@ class hs:
                                       self.thick[1].thick_faces[5], self.thick[2].thick_faces[1]))
         self.thin[7].set_thick_faces((self.thick[1].thick_faces[4],
                                       self.thick[3].thick_faces[0], self.thick[2].thick_faces[2]))
+        # Record where each cross-bridge sits in the thick location array
+        self._xb_node = np.array([
+            xb.parent_face.parent_filament.index * n_crowns + xb.index
+            for xb in self._crossbridges])
+        # and the (y, z) direction its crown gives its radial force
+        self._xb_orient = np.zeros((n_xb, 2))
+        for thick in self.thick:
+            for crown in thick.crowns:
+                for xb, orient in zip(crown.crossbridges, crown.orientations):
+                    self._xb_orient[xb._flat_index] = orient
+        # and which thin face each cross-bridge looks to for binding sites
+        self._thin_faces = [face for thin in self.thin
+                            for face in thin.thin_faces]
+        face_ids = {id(face): i for i, face in enumerate(self._thin_faces)}
+        self._xb_thin_face = np.array([face_ids[id(xb.thin_face)]
+                                       for xb in self._crossbridges])
+        self._face_sites = np.array([face._site_flat
+                                     for face in self._thin_faces])
+        # and the (thick filament, crown, head) order transitions report in
+        self._xb_by_crown = np.array([
+            [[xb._flat_index for xb in crown.crossbridges]
+             for crown in thick.crowns] for thick in self.thick])
         # Set the timestep for all our new cross-bridges
         self.timestep_len = timestep_len
         # Set actin_permissiveness for all our new binding sites
@@ -275,6 +377,18 @@ class hs:
             thin: the structures for the thin filaments
         """
         sd = self.__dict__.copy()  # sarc dict
+        for key in ('thick_axial', 'thin_axial', 'xb_state', 'xb_bound',
+                    'bs_bound', 'bs_permissiveness', '_crossbridges',
+                    '_binding_sites', '_xb_node', '_xb_by_crown',
+                    '_thin_faces', '_xb_thin_face', '_face_sites',
+                    '_xb_orient', '_bound_pairs', '_settled_z_line',
+                    'instruments', '_transition_codes'):
+            sd.pop(key)  # recorded in the sub-structures below
+        sd.pop('rng')  # restarted from the seed
+        if isinstance(self.seed, np.random.SeedSequence):
+            sd['seed'] = {'entropy': self.seed.entropy,
+                          'spawn_key': list(self.seed.spawn_key)}
+        sd['backend'] = sd.pop('_backend')
         sd['current_timestep'] = self.current_timestep
         # set act_perm as mean since prop access returns values at every point
         sd['actin_permissiveness'] = np.mean(self.actin_permissiveness)
@@ -292,6 +406,11 @@ class hs:
             import warnings
             warnings.warn("Versioning mismatch, reading %0.1f into %0.1f."
                           % (read, current))
+        # Spawned seeds are stored by their entropy and spawn key
+        seed = sd.get('seed')
+        if isinstance(seed, dict):
+            seed = np.random.SeedSequence(seed['entropy'],
+                                          spawn_key=seed['spawn_key'])
         # Get filaments in right orientations
         self.__init__(
             lattice_spacing=sd['_initial_lattice_spacing'],
@@ -300,7 +419,12 @@ class hs:
             actin_permissiveness=sd['actin_permissiveness'],
             timestep_len=sd['timestep_len'],
             time_dependence=sd['time_dependence'],
-            starts=(sd['_thin_starts'], sd['_thick_starts'])
+            starts=(sd['_thin_starts'], sd['_thick_starts']),
+            solver=sd.get('solver'),
+            backend=sd.get('backend'),
+            rate_tolerance=sd.get('rate_tolerance'),
+            seed=seed,
+            predictor=sd.get('predictor')
         )
         # Local keys
         self.current_timestep = sd['current_timestep']
@@ -309,12 +433,122 @@ class hs:
         self.hiding_line = sd['hiding_line']
         if 'last_transitions' in sd.keys():
             self.last_transitions = sd['last_transitions']
+        if 'last_settle_iterations' in sd.keys():
+            self.last_settle_iterations = sd['last_settle_iterations']
         # Sub-structure keys
         for data, thick in zip(sd['thick'], self.thick):
             thick.from_dict(data)
         for data, thin in zip(sd['thin'], self.thin):
             thin.from_dict(data)
 
+    # The lattice state arrays a snapshot holds
+    _SNAPSHOT_ARRAYS = ('thick_axial', 'thin_axial', 'xb_state', 'xb_bound',
+                        'bs_bound', 'bs_permissiveness')
+
+    def _settings(self):
+        """The values the half-sarcomere was created with, as JSON"""
+        seed = self.seed
+        if isinstance(seed, np.random.SeedSequence):
+            seed = {'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key)}
+        # Time dependence may be given as arrays, which JSON can't hold
+        time_dependence = self.time_dependence
+        if time_dependence is not None:
+            time_dependence = {key: np.asarray(value).tolist()
+                               for key, value in time_dependence.items()}
+        return json.dumps({
+            'version': self.version,
+            'lattice_spacing': self._initial_lattice_spacing,
+            'z_line': self._initial_z_line,
+            'poisson': self.poisson_ratio,
+            'timestep_len': self.timestep_len,
+            'time_dependence': time_dependence,
+            'starts': [list(self._thin_starts), list(self._thick_starts)],
+            'solver': self.solver,
+            'backend': self.backend,
+            'rate_tolerance': self.rate_tolerance,
+            'seed': seed,
+            'predictor': self.predictor}, sort_keys=True)
+
+    def to_snapshot(self, filename, compress=False):
+        """Save the state of the half-sarcomere to a binary .npz file
+
+        Unlike to_dict, only the lattice state arrays are written, along
+        with the settings the half-sarcomere was created with, its random
+        stream's state, and its place in time. Saving and restoring take
+        milliseconds and a restored half-sarcomere continues exactly as
+        the original would have.
+
+        Parameters:
+            filename: where to write the snapshot, numpy adds .npz if it
+                isn't there already
+            compress: whether to zip compress the arrays (False)
+        """
+        arrays = {name: getattr(self, name) for name in self._SNAPSHOT_ARRAYS}
+        state = {
+            'current_timestep': self.current_timestep,
+            'z_line': self.z_line,
+            'lattice_spacing': self.lattice_spacing,
+            'hiding_line': self.hiding_line,
+            'settled_z_line': self._settled_z_line,
+            'rng': self.rng.bit_generator.state}
+        save = np.savez_compressed if compress else np.savez
+        save(filename, settings=np.array(self._settings()),
+             state=np.array(json.dumps(state)), **arrays)
+
+    def from_snapshot(self, filename):
+        """Restore the state saved by to_snapshot
+
+        The filaments are only rebuilt if the snapshot was taken of a
+        half-sarcomere created with other settings, such as other starts,
+        so restoring repeatedly into the same half-sarcomere is quick.
+
+        Parameters:
+            filename: the .npz file written by to_snapshot
+        """
+        with np.load(filename) as snapshot:
+            settings = str(snapshot['settings'])
+            state = json.loads(str(snapshot['state']))
+            arrays = {name: snapshot[name] for name in snapshot.files
+                      if name not in ('settings', 'state')}
+        if settings != self._settings():
+            sd = json.loads(settings)
+            if sd['version'] != self.version:
+                import warnings
+                warnings.warn("Versioning mismatch, reading %0.1f into %0.1f."
+                              % (sd['version'], self.version))
+            seed = sd['seed']
+            if isinstance(seed, dict):
+                seed = np.random.SeedSequence(seed['entropy'],
+                                              spawn_key=seed['spawn_key'])
+            time_dependence = sd['time_dependence']
+            if time_dependence is not None:
+                time_dependence = {key: np.asarray(value)
+                                   for key, value in time_dependence.items()}
+            self.__init__(
+                lattice_spacing=sd['lattice_spacing'],
+                z_line=sd['z_line'],
+                poisson=sd['poisson'],
+                timestep_len=sd['timestep_len'],
+                time_dependence=time_dependence,
+                starts=sd['starts'],
+                solver=sd['solver'],
+                backend=sd['backend'],
+                rate_tolerance=sd['rate_tolerance'],
+                seed=seed,
+                predictor=sd['predictor'],
+                instruments=self.instruments
+            )
+        # Place in time first, as it resets the boundary conditions
+        self.current_timestep = state['current_timestep']
+        self._z_line = state['z_line']
+        self._lattice_spacing = state['lattice_spacing']
+        self.hiding_line = state['hiding_line']
+        self.rng.bit_generator.state = state['rng']
+        for name in self._SNAPSHOT_ARRAYS:
+            getattr(self, name)[...] = arrays[name]
+        self._bound_pairs = None
+        self._settled_z_line = state.get('settled_z_line')
+
     def run(self, time_steps=100, callback=None, bar=True, every=5):
         """Run the model for the specified number of timesteps
 
@@ -351,7 +585,11 @@ class hs:
         for i in range(time_steps):
             try:
                 self.timestep()
+                tic_callback = time.perf_counter()
                 output.append(callback())
+                if self.instruments is not None:
+                    self.instruments.add_time(
+                        'callback', time.perf_counter() - tic_callback)
                 # Update us on how it went
                 toc = int((time.time() - tic) / (i + 1) * (time_steps - i - 1))
                 proc_name = mp.current_process().name
@@ -389,9 +627,121 @@ class hs:
         else:
             self.current_timestep += 1
         # Update bound states
-        self.last_transitions = [thick.transition() for thick in self.thick]
-        # Settle forces
-        self.settle()
+        tic = time.perf_counter()
+        self.last_transitions = self.transition()
+        toc = time.perf_counter()
+        # Settle forces, from a guess at where they will balance
+        self._predict()
+        self.last_settle_iterations = self.settle()
+        if self.instruments is not None:
+            self.instruments.add_step(self, transition=toc - tic,
+                                      settle=time.perf_counter() - toc)
+        if self.predictor is not None:
+            self._settled_z_line = self.z_line
+
+    def _predict(self):
+        """Move the filaments to where they are expected to settle
+
+        The filaments are still where the last timestep settled them, so
+        the guess shifts the thin filaments by however far the z-line has
+        moved since then, leaving the thick filaments in place.
+        """
+        if self.predictor is None or self._settled_z_line is None:
+            return
+        self.thin_axial += self.z_line - self._settled_z_line
+
+    def transition(self):
+        """Give every cross-bridge a chance to transition, all at once
+
+        This is the batched equivalent of calling ThickFilament.transition
+        on each thick filament. Rates for every head are found together by
+        Head.batch_transition and the resulting binding changes are then
+        applied to the lattice state arrays. Unbinding is applied before
+        binding, and a site sought by more than one head goes to the first
+        of them. As in Crossbridge.transition, a '12' transition onto a site
+        that is already taken is reported but leaves the head free.
+
+        Returns:
+            transitions: the transition ('12', '32', etc.) or None of each
+                cross-bridge, nested by thick filament and crown
+        """
+        head = self._crossbridges[0]
+        bound = self.xb_bound >= 0
+        base = self.thick_axial.flat[self._xb_node]
+        # Free heads look to the nearest site on their opposing thin face,
+        # searched for a whole face at a time
+        site = self.xb_bound.copy()
+        free = np.flatnonzero(~bound)
+        if self.backend == "numba":
+            from multifil import jit
+            site[free] = jit.nearest_sites(
+                self.thin_axial.ravel(), self._face_sites,
+                self._xb_thin_face[free], base[free], self.hiding_line)
+        else:
+            faces = self._xb_thin_face[free]
+            for face_id in np.unique(faces):
+                heads = free[faces == face_id]
+                face = self._thin_faces[face_id]
+                site[heads] = face._site_flat[face.nearest_index(base[heads])]
+        axial_sep = self.thin_axial.flat[site] - base
+        actin_state = self.bs_permissiveness.flat[site]
+        if self.backend == "numba":
+            codes = jit.transition_codes(head, axial_sep,
+                                         self.lattice_spacing, actin_state,
+                                         self.xb_state, self.rng)
+        else:
+            table = None
+            if self.rate_tolerance is not None:
+                table = head.rate_table(self.rate_tolerance)
+            codes = head.batch_transition((axial_sep, self.lattice_spacing),
+                                          actin_state, self.xb_state, table,
+                                          self.rng)
+        # Unbind, from either the loose or the tight state
+        unbinding = (codes == 2) | (codes == 5)
+        self.bs_bound[self.xb_bound[unbinding]] = -1
+        self.xb_bound[unbinding] = -1
+        self.xb_state[unbinding] = 0
+        # Power stroke and its reverse
+        self.xb_state[codes == 3] = 2
+        self.xb_state[codes == 4] = 1
+        # Bind, where the site is open and not sought by an earlier head
+        binding = np.flatnonzero(codes == 1)
+        sought, first = np.unique(site[binding], return_index=True)
+        binding = binding[first[self.bs_bound[sought] < 0]]
+        self.xb_bound[binding] = site[binding]
+        self.bs_bound[site[binding]] = binding
+        self.xb_state[binding] = 1
+        if self.instruments is not None:
+            attempts = int(np.count_nonzero(codes == 1))
+            self.instruments.count('bind_attempts', attempts)
+            self.instruments.count('failed_binds', attempts - len(binding))
+        # Keep the bound pairs current, dropping the heads that unbound and
+        # adding those that bound rather than searching all the heads
+        xb = self._bound()[0]
+        xb = np.union1d(xb[~unbinding[xb]], binding)
+        self._bound_pairs = (xb, self.xb_bound[xb])
+        # Report transitions as ThickFilament.transition would
+        self._transition_codes = codes
+        names = np.array(mh.TRANSITIONS, dtype=object)[codes]
+        return names[self._xb_by_crown].tolist()
+
+    @property
+    def backend(self):
+        """Which backend computes the kinetics and the relaxation sweeps"""
+        return self._backend
+
+    @backend.setter
+    def backend(self, new_backend):
+        """Choose a backend, falling back to numpy if numba is missing"""
+        if new_backend == "numba":
+            from multifil import jit
+            if not jit.available:
+                import warnings
+                warnings.warn("numba is not installed, using numpy backend")
+                new_backend = "numpy"
+        elif new_backend != "numpy":
+            raise ValueError("Unknown backend: %s" % new_backend)
+        self._backend = new_backend
 
     @property
     def current_timestep(self):
@@ -501,37 +851,370 @@ class hs:
 
     def radial_tension(self):
         """The sum of the thick filaments' radial tensions"""
-        return sum([t.radial_tension() for t in self.thick])
+        return float(np.sum(self._xb_radial_forces()))
 
     def radial_force(self):
         """The sum of the thick filaments' radial forces, as a (y,z) vector"""
-        return np.sum([t.radial_force_of_filament() for t in self.thick], 0)
+        xb = self._bound()[0]
+        return self._xb_radial_forces() @ self._xb_orient[xb]
+
+    def _add_crossbridge(self, crossbridge):
+        """Register a new cross-bridge, returning its flat index"""
+        self._crossbridges.append(crossbridge)
+        return len(self._crossbridges) - 1
+
+    def _add_binding_site(self, binding_site):
+        """Register a new binding site, returning its flat index"""
+        self._binding_sites.append(binding_site)
+        return len(self._binding_sites) - 1
+
+    def _filament_constants(self):
+        """Stiffness and rest spacings of the filaments, as arrays
 
-    def _single_settle(self, factor=0.95):
-        """Settle down now, just a little bit"""
-        thick = [thick.settle(factor) for thick in self.thick]
-        thin = [thin.settle(factor) for thin in self.thin]
+        Returns:
+            (thick_k, thick_rests, thin_k, thin_rests): (4, 1), (4, 60),
+                (8, 1), and (8, 90) arrays
+        """
+        thick_k = np.array([[t.k] for t in self.thick], dtype=float)
+        thick_rests = np.vstack([t.rests for t in self.thick])
+        thin_k = np.array([[t.k] for t in self.thin], dtype=float)
+        thin_rests = np.vstack([t.rests for t in self.thin])
+        return thick_k, thick_rests, thin_k, thin_rests
+
+    def _bound(self):
+        """Flat indices of the bound cross-bridges and the sites they hold
+
+        Unbound heads exert no force, so the force assembly works over these
+        pairs alone. They are kept up to date by transition and are found
+        afresh after any other change to xb_bound.
+
+        Returns:
+            (xb, bs): arrays of the cross-bridge and binding site flat index
+                of each bound pair, in cross-bridge order
+        """
+        if self._bound_pairs is None:
+            xb = np.flatnonzero(self.xb_bound >= 0)
+            self._bound_pairs = (xb, self.xb_bound[xb])
+        return self._bound_pairs
+
+    def _bound_separations(self):
+        """Tip to crown distances of the bound pairs, as from _bound
+
+        Returns:
+            (axial, lattice_spacing): arrays over the bound pairs
+        """
+        xb, bs = self._bound()
+        axial = self.thin_axial.flat[bs] - self.thick_axial.flat[
+            self._xb_node[xb]]
+        # Lattice spacing may be a value per cross-bridge, as in an ensemble
+        lattice_spacing = np.broadcast_to(self.lattice_spacing,
+                                          self.xb_state.shape)[xb]
+        return axial, lattice_spacing
+
+    def _xb_axial_forces(self):
+        """Axial force of each bound cross-bridge
+
+        Returns:
+            forces: array of the force each bound cross-bridge, in the order
+                of _bound, exerts on its crown, its binding site feels the
+                opposite
+        """
+        head = self._crossbridges[0]
+        return head.batch_axial_force(self._bound_separations(),
+                                      self.xb_state[self._bound()[0]])
+
+    def _xb_radial_forces(self):
+        """Radial force of each bound cross-bridge, in the order of _bound"""
+        head = self._crossbridges[0]
+        return head.batch_radial_force(self._bound_separations(),
+                                       self.xb_state[self._bound()[0]])
+
+    def _thick_node_forces(self, thick_k, thick_rests, xb_forces=None):
+        """Net axial force at each thick filament node, (4, 60) array
+
+        This is the array form of ThickFilament.axial_force, combining the
+        backbone strain with the force from any bound cross-bridges.
+        """
+        if xb_forces is None:
+            xb_forces = self._xb_axial_forces()
+        m_line = np.zeros((len(self.thick_axial), 1))
+        dists = np.diff(np.hstack([m_line, self.thick_axial]), axis=1)
+        spring_force = np.hstack([(dists - thick_rests) * thick_k, m_line])
+        crowns = np.bincount(self._xb_node[self._bound()[0]], xb_forces,
+                             minlength=self.thick_axial.size)
+        return np.diff(spring_force, axis=1) + crowns.reshape(
+            self.thick_axial.shape)
+
+    def _thin_node_forces(self, thin_k, thin_rests, xb_forces=None):
+        """Net axial force at each thin filament node, (8, 90) array
+
+        This is the array form of ThinFilament.axial_force, combining the
+        backbone strain with the force from any bound cross-bridges.
+        """
+        if xb_forces is None:
+            xb_forces = self._xb_axial_forces()
+        z_line = np.full((len(self.thin_axial), 1), float(self.z_line))
+        dists = np.diff(np.hstack([self.thin_axial, z_line]), axis=1)
+        spring_force = np.hstack([np.zeros_like(z_line),
+                                  (dists - thin_rests) * thin_k])
+        sites = np.bincount(self._bound()[1], -xb_forces,
+                            minlength=self.thin_axial.size)
+        return np.diff(spring_force, axis=1) + sites.reshape(
+            self.thin_axial.shape)
+
+    def _single_settle(self, factor=0.95, constants=None):
+        """Settle down now, just a little bit
+
+        This moves every thick filament, then every thin filament, as in
+        ThickFilament.settle and ThinFilament.settle, working on the whole
+        lattice's location arrays at once.
+        """
+        if constants is None:
+            constants = self._filament_constants()
+        thick_k, thick_rests, thin_k, thin_rests = constants
+        # Thick filaments, the last node has a spring on only one side
+        thick = self._thick_node_forces(thick_k, thick_rests)
+        isolated = factor * thick / thick_k
+        isolated[:, -1] *= 2
+        self.thick_axial += np.cumsum(isolated, axis=1)
+        # Thin filaments, the first node has a spring on only one side
+        thin = self._thin_node_forces(thin_k, thin_rests)
+        isolated = factor * thin / thin_k
+        isolated[:, 0] *= 2
+        self.thin_axial += np.cumsum(isolated[:, ::-1], axis=1)[:, ::-1]
         return np.max((np.max(np.abs(thick)), np.max(np.abs(thin))))
 
-    def settle(self):
+    def _newton_step(self, constants, converge_limit):
+        """Take one Newton step towards force balance, if one is needed
+
+        The backbone of each filament is a chain of linear springs, giving a
+        tridiagonal stiffness whose inverse is fixed. Each bound cross-bridge
+        couples one thick node to one thin node through its linearized axial
+        stiffness, a rank one update. The Newton step is then found exactly
+        with the Woodbury identity, needing only a dense solve the size of
+        the number of bound cross-bridges.
+
+        Returns:
+            residual: the largest absolute axial force before the step
+        """
+        thick_k, thick_rests, thin_k, thin_rests = constants
+        n_crowns, n_nodes = self.thick_axial.shape[1], self.thin_axial.shape[1]
+        xb_forces = self._xb_axial_forces()
+        thick = self._thick_node_forces(thick_k, thick_rests, xb_forces)
+        thin = self._thin_node_forces(thin_k, thin_rests, xb_forces)
+        residual = np.max((np.max(np.abs(thick)), np.max(np.abs(thin))))
+        if residual <= converge_limit:
+            return residual
+        # Backbone compliances, the inverse of each filament's stiffness
+        thick_c = _backbone_compliance(n_crowns, free_end=True)
+        thin_c = _backbone_compliance(n_nodes, free_end=False)
+        # Stiffness of each bound cross-bridge and the nodes it links
+        xb, bs = self._bound()
+        a, i = np.divmod(self._xb_node[xb], n_crowns)
+        b, j = np.divmod(bs, n_nodes)
+        head = self._crossbridges[0]
+        xb_k = head.batch_axial_stiffness(self._bound_separations(),
+                                          self.xb_state[xb])
+        # Displacement from the backbones alone, then the coupling correction
+        thick_d = -thick @ thick_c / thick_k
+        thin_d = -thin @ thin_c / thin_k
+        coupling = (np.equal.outer(a, a) * thick_c[np.ix_(i, i)] / thick_k[a] +
+                    np.equal.outer(b, b) * thin_c[np.ix_(j, j)] / thin_k[b])
+        mismatch = thin_d[b, j] - thick_d[a, i]
+        z = np.linalg.solve(np.eye(len(xb)) - xb_k[:, None] * coupling,
+                            xb_k * mismatch)
+        thick_z, thin_z = np.zeros_like(thick_d), np.zeros_like(thin_d)
+        np.add.at(thick_z, (a, i), z)
+        np.add.at(thin_z, (b, j), z)
+        self.thick_axial += thick_d - thick_z @ thick_c / thick_k
+        self.thin_axial += thin_d + thin_z @ thin_c / thin_k
+        return residual
+
+    def settle(self, solver=None):
         """Jiggle those locations around until the residual forces are low
 
         We choose the convergence limit so that 95% of thermal forcing events
         result in a deformation that produces more axial force than the
         convergence value, 0.12pN.
+
+        Parameters:
+            solver: "relax" or "newton", overriding the solver
+                chosen on creation for this call only
+        Returns:
+            iterations: the number of relaxation sweeps and Newton steps
+                taken, as recorded by timestep in last_settle_iterations
         """
         converge_limit = 0.12  # see doc string
-        converge = self._single_settle()
+        iterations = 0
+        if solver is None:
+            solver = self.solver
+        constants = self._filament_constants()
+        if solver == "newton":
+            # Newton steps nearly always converge in a handful of steps, if
+            # they haven't by now the relaxation sweeps below finish up
+            for _ in range(20):
+                if self._newton_step(constants, converge_limit) <= \
+                        converge_limit:
+                    return iterations
+                iterations += 1
+        elif solver != "relax":
+            raise ValueError("Unknown solver: %s" % solver)
+        if self.backend == "numba":
+            from multifil import jit
+            thick_k, thick_rests, thin_k, thin_rests = constants
+            xb, bs = self._bound()
+            sweeps = jit.relax(self.thick_axial, self.thin_axial, thick_k,
+                               thick_rests, thin_k, thin_rests,
+                               float(self.z_line), self._xb_node[xb], bs,
+                               self.xb_state[xb], float(self.lattice_spacing),
+                               jit.head_params(self._crossbridges[0]), 0.95,
+                               converge_limit)
+            return iterations + sweeps
+        converge = self._single_settle(constants=constants)
+        iterations += 1
         while converge > converge_limit:
-            converge = self._single_settle()
+            converge = self._single_settle(constants=constants)
+            iterations += 1
+        return iterations
 
     def _get_residual(self):
         """Get the residual force at every point in the half-sarcomere"""
-        thick_f = np.hstack([t.axial_force() for t in self.thick])
-        thin_f = np.hstack([t.axial_force() for t in self.thin])
-        mash = np.hstack([thick_f, thin_f])
+        thick_k, thick_rests, thin_k, thin_rests = self._filament_constants()
+        xb_forces = self._xb_axial_forces()
+        thick_f = self._thick_node_forces(thick_k, thick_rests, xb_forces)
+        thin_f = self._thin_node_forces(thin_k, thin_rests, xb_forces)
+        mash = np.hstack([thick_f.ravel(), thin_f.ravel()])
         return mash
 
+    # Names of the values metrics finds, by the part of the lattice they
+    # need looked at
+    FORCE_METRICS = ('axial_force', 'radial_force_y', 'radial_force_z',
+                     'radial_tension')
+    KINETIC_METRICS = ('xb_fraction_free', 'xb_fraction_loose',
+                       'xb_fraction_tight', 'xb_trans_12', 'xb_trans_21',
+                       'xb_trans_23', 'xb_trans_32', 'xb_trans_31',
+                       'xb_trans_13', 'xb_trans_static')
+    DISPLACEMENT_METRICS = tuple([fil + '_displace_' + stat
+                                  for fil in ('thick', 'thin')
+                                  for stat in ('mean', 'max', 'min', 'std')])
+    METRICS = (('timestep', 'z_line', 'lattice_spacing',
+                'actin_permissiveness') + FORCE_METRICS + KINETIC_METRICS +
+               DISPLACEMENT_METRICS)
+    PROFILES = ('crown_force', 'site_binding', 'xb_state', 'thick_axial',
+                'thin_axial')
+
+    def metrics(self, names=None):
+        """Per-timestep values, as run.data_file records them
+
+        The forces, state fractions, transition counts, and filament
+        displacements are all found from the lattice state arrays, rather
+        than by asking each filament and cross-bridge in turn. Only the
+        parts of the lattice the asked for values need are looked at.
+
+        Parameters:
+            names: which of METRICS to find, all of them if not given
+        Returns:
+            metrics: dict of the asked for values, of those the timestep,
+                z_line, lattice_spacing, axial_force, radial_force_y and
+                _z, radial_tension, the xb_fraction_ free, loose, and tight,
+                the count of each transition as xb_trans_12 etc. and
+                xb_trans_static for none, the mean actin_permissiveness,
+                and the mean, max, min, and std of the thick_displace and
+                thin_displace
+        """
+        wanted = set(self.METRICS if names is None else names)
+        metrics = {
+            'timestep': self.current_timestep,
+            'z_line': self.z_line,
+            'lattice_spacing': self.lattice_spacing,
+            'actin_permissiveness': float(np.mean(self.bs_permissiveness))}
+        if not wanted.isdisjoint(self.FORCE_METRICS):
+            metrics.update(self._force_metrics())
+        if not wanted.isdisjoint(self.KINETIC_METRICS):
+            metrics.update(self._kinetic_metrics())
+        if not wanted.isdisjoint(self.DISPLACEMENT_METRICS):
+            metrics.update(self._displacement_metrics())
+        if names is None:
+            return metrics
+        return {name: metrics[name] for name in names}
+
+    def _force_metrics(self):
+        """The FORCE_METRICS, see metrics"""
+        # The M-line feels only the crown next to it
+        thick_k = np.array([thick.k for thick in self.thick], dtype=float)
+        b_z = np.array([thick.b_z for thick in self.thick])
+        axial_force = np.sum((self.thick_axial[:, 0] - b_z) * thick_k)
+        radial = self._xb_radial_forces()
+        radial_force = radial @ self._xb_orient[self._bound()[0]]
+        return {'axial_force': float(axial_force),
+                'radial_force_y': float(radial_force[0]),
+                'radial_force_z': float(radial_force[1]),
+                'radial_tension': float(np.sum(radial))}
+
+    def _kinetic_metrics(self):
+        """The KINETIC_METRICS, see metrics"""
+        fractions = np.bincount(self.xb_state, minlength=3) / \
+            self.xb_state.size
+        if self._transition_codes is None:
+            codes = np.zeros(self.xb_state.size, dtype=np.int8)
+        else:
+            codes = self._transition_codes
+        counts = dict(zip(mh.TRANSITIONS,
+                          np.bincount(codes, minlength=len(mh.TRANSITIONS))))
+        metrics = {
+            'xb_fraction_free': float(fractions[0]),
+            'xb_fraction_loose': float(fractions[1]),
+            'xb_fraction_tight': float(fractions[2]),
+            'xb_trans_13': 0,  # not a transition the kinetics allow
+            'xb_trans_static': int(counts[None])}
+        for trans in mh.TRANSITIONS[1:]:
+            metrics['xb_trans_' + trans] = int(counts[trans])
+        return metrics
+
+    def _displacement_metrics(self):
+        """The DISPLACEMENT_METRICS, see metrics"""
+        thick_k, thick_rests, thin_k, thin_rests = self._filament_constants()
+        # Displacement of each node from its rest spacing
+        m_line = np.zeros((len(self.thick_axial), 1))
+        thick_d = np.diff(np.hstack([m_line, self.thick_axial]),
+                          axis=1) - thick_rests
+        z_line = np.full((len(self.thin_axial), 1), float(self.z_line))
+        thin_d = np.diff(np.hstack([self.thin_axial, z_line]),
+                         axis=1) - thin_rests
+        metrics = {}
+        for name, displace in (('thick_displace', thick_d),
+                               ('thin_displace', thin_d)):
+            metrics[name + '_mean'] = float(np.mean(displace))
+            metrics[name + '_max'] = float(np.max(displace))
+            metrics[name + '_min'] = float(np.min(displace))
+            metrics[name + '_std'] = float(np.std(displace))
+        return metrics
+
+    def profile(self, name):
+        """A spatial profile of the lattice's current state
+
+        Parameters:
+            name: one of PROFILES
+                * "crown_force" - axial force of the bound cross-bridges
+                  on each crown, (4, 60)
+                * "site_binding" - flat index of the cross-bridge bound to
+                  each binding site, or -1, (8, 90)
+                * "xb_state" - state of each cross-bridge, (720,)
+                * "thick_axial", "thin_axial" - node locations
+        Returns:
+            profile: a new array of the profile's values
+        """
+        if name == 'crown_force':
+            crowns = np.bincount(self._xb_node[self._bound()[0]],
+                                 self._xb_axial_forces(),
+                                 minlength=self.thick_axial.size)
+            return crowns.reshape(self.thick_axial.shape)
+        elif name == 'site_binding':
+            return self.bs_bound.reshape(self.thin_axial.shape).copy()
+        elif name in ('xb_state', 'thick_axial', 'thin_axial'):
+            return getattr(self, name).copy()
+        raise ValueError("Unknown profile: %s" % name)
+
     def get_frac_in_states(self):
         """Calculate the fraction of cross-bridges in each state"""
         nested = [t.get_states() for t in self.thick]
@@ -611,4 +1294,19 @@ class hs:
         warnings.warn("Unresolvable address: %s" % str(address))
 
 
-sarc = hs()
+@functools.lru_cache(maxsize=None)
+def _backbone_compliance(nodes, free_end):
+    """Inverse of a filament backbone's stiffness matrix, for k = 1
+
+    The backbone is a chain of springs between nodes, anchored by a spring
+    at one end. When free_end is True the anchor is before the first node
+    and the last node is free, as in a thick filament tied to the M-line.
+    Otherwise the anchor is after the last node and the first node is free,
+    as in a thin filament tied to the Z-line. The stiffness matrix is the
+    derivative of the node forces with respect to the node locations.
+    """
+    stiffness = (np.diag(np.full(nodes, -2.0)) +
+                 np.diag(np.ones(nodes - 1), 1) +
+                 np.diag(np.ones(nodes - 1), -1))
+    stiffness[(-1, -1) if free_end else (0, 0)] = -1.0
+    return np.linalg.inv(stiffness)
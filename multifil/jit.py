@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+jit.py - compiled versions of the timestep hot path
+
+The half-sarcomere's kinetics and force balance are written as array
+operations in hs and mh. When numba is installed this module provides
+compiled loops doing the same work without the temporaries: the cross-bridge
+rate functions of mh.Head, the nearest binding site search of ThinFace, the
+node force assembly of ThickFilament/ThinFilament.axial_force, and the
+relaxation loop of hs.settle. They are used by a half-sarcomere created
+with backend="numba".
+
+Without numba the functions below are left as plain Python, which is
+correct but slow, and hs falls back to the NumPy backend instead.
+
+Random draws inside the compiled kinetics use numba's own generator. It is
+seeded from the half-sarcomere's Generator on each call, so seeded runs
+remain reproducible, though they do not draw the same numbers as the NumPy
+backend; results agree statistically rather than exactly.
+"""
+
+import math
+import numpy as np
+import numpy.random as random
+
+try:
+    from numba import njit
+    available = True
+except ImportError:
+    available = False
+
+    def njit(*args, **kwargs):
+        """Stand in for numba.njit, leaving the function as plain Python"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# ## Head parameters, packed into an array for the compiled functions
+# Order of the packed values, see head_params
+_C_RW, _C_RS, _C_KW, _C_KS, _C_SD = 0, 1, 2, 3, 4
+_G_RW, _G_RS, _G_KW, _G_KS, _G_SD = 5, 6, 7, 8, 9
+_ALPHA_DG, _ETA_DG = 10, 11
+
+
+def head_params(head):
+    """Pack the spring and free energy parameters of a Head into an array
+
+    Takes:
+        head: the mh.Head whose parameters all heads share
+    Returns:
+        params: float array, indexed by the _C_*, _G_*, and *_DG constants
+    """
+    return np.array([head.c.r_w, head.c.r_s, head.c.k_w, head.c.k_s,
+                     head.c.stand_dev, head.g.r_w, head.g.r_s, head.g.k_w,
+                     head.g.k_s, head.g.stand_dev, head.alphaDG,
+                     head.etaDG])
+
+
+# ## Cross-bridge mechanics, as in mh.Head
+@njit(cache=True)
+def _energy(x, y, state, params):
+    """Energy stored in a head with its tip at (x, y), as Head.energy"""
+    c_ang = math.atan2(y, x)
+    g_len = math.hypot(y, x)
+    if state == 2:
+        c = 0.5 * params[_C_KS] * (c_ang - params[_C_RS]) ** 2
+        g = 0.5 * params[_G_KS] * (g_len - params[_G_RS]) ** 2
+    else:
+        c = 0.5 * params[_C_KW] * (c_ang - params[_C_RW]) ** 2
+        g = 0.5 * params[_G_KW] * (g_len - params[_G_RW]) ** 2
+    return c + g
+
+
+@njit(cache=True)
+def _axial_force(x, y, state, params):
+    """Axial force of a head with its tip at (x, y), as Head.axial_force"""
+    c_ang = math.atan2(y, x)
+    g_len = math.hypot(y, x)
+    if state == 2:
+        c_s, c_k = params[_C_RS], params[_C_KS]
+        g_s, g_k = params[_G_RS], params[_G_KS]
+    else:
+        c_s, c_k = params[_C_RW], params[_C_KW]
+        g_s, g_k = params[_G_RW], params[_G_KW]
+    return (g_k * (g_len - g_s) * math.cos(c_ang) +
+            1 / g_len * c_k * (c_ang - c_s) * math.sin(c_ang))
+
+
+@njit(cache=True)
+def _bind(x, y, params):
+    """Binding rate for a tip to actin distance (x, y), as Head._bind"""
+    tip_x, tip_y = 0.0, y + 1.0
+    while tip_y > y:
+        c_ang = random.normal(params[_C_RW], params[_C_SD])
+        g_len = random.normal(params[_G_RW], params[_G_SD])
+        tip_x = g_len * math.cos(c_ang)
+        tip_y = g_len * math.sin(c_ang)
+    distance = math.hypot(x - tip_x, y - tip_y)
+    return 72 * math.exp(-distance ** 2)
+
+
+@njit(cache=True)
+def _r23(x, y, params):
+    """Loose to tight rate, as Head._r23"""
+    loose = _energy(x, y, 1, params)
+    tight = _energy(x, y, 2, params)
+    return 0.6 * (1 + math.tanh(6 + 0.2 * (loose - tight)))
+
+
+@njit(cache=True)
+def _prob(rate, timestep_len):
+    """Probability of a Poisson event in a timestep, as Head._prob"""
+    return 1 - math.exp(-rate * timestep_len)
+
+
+@njit(cache=True)
+def _transition_codes(axial, lattice_spacing, ap, state, params,
+                      timestep_len, seed):
+    """Transition codes for every head, as Head.batch_transition"""
+    random.seed(seed)
+    codes = np.zeros(len(state), dtype=np.int8)
+    for i in range(len(state)):
+        x, y = axial[i], lattice_spacing[i]
+        check = random.random()
+        if state[i] == 0:
+            if _prob(_bind(x, y, params), timestep_len) * ap[i] > check:
+                codes[i] = 1
+        elif state[i] == 1:
+            if _prob(_r23(x, y, params), timestep_len) > check:
+                codes[i] = 3
+                continue
+            denominator = math.exp(
+                -(params[_ALPHA_DG] + _energy(x, y, 1, params)))
+            rate = 1.0
+            if denominator != 0:
+                rate = _bind(x, y, params) / denominator
+            if 1 - _prob(rate, timestep_len) < check:
+                codes[i] = 2
+        else:
+            tight = _energy(x, y, 2, params)
+            if _prob(math.sqrt(0.01 * tight) + 0.02, timestep_len) > check:
+                codes[i] = 5
+                continue
+            denominator = math.exp(
+                params[_ALPHA_DG] + _energy(x, y, 1, params) -
+                params[_ETA_DG] - tight)
+            rate = 1.0
+            if denominator != 0:
+                rate = _r23(x, y, params) / denominator
+            if 1 - _prob(rate, timestep_len) < check:
+                codes[i] = 4
+    return codes
+
+
+def transition_codes(head, axial, lattice_spacing, ap, numeric_state,
+                     rng=None):
+    """Compiled equivalent of Head.batch_transition
+
+    Takes:
+        head: the mh.Head whose parameters all heads share
+        axial: array of axial crown to actin distances
+        lattice_spacing: lattice spacing, a float or an array
+        ap: array of actin binding permissiveness, from 0 to 1
+        numeric_state: array of current states of each head (0, 1, 2)
+        rng: numpy Generator to seed the draws from, numpy.random if not
+            given
+    Returns:
+        codes: array of transition codes, indices into mh.TRANSITIONS
+    """
+    if rng is None:
+        seed = random.randint(2 ** 31)
+    else:
+        seed = rng.integers(2 ** 31)
+    axial = np.ascontiguousarray(axial, dtype=float)
+    lattice_spacing = np.ascontiguousarray(np.broadcast_to(
+        lattice_spacing, axial.shape), dtype=float)
+    ap = np.ascontiguousarray(np.broadcast_to(ap, axial.shape), dtype=float)
+    return _transition_codes(axial, lattice_spacing, ap,
+                             np.asarray(numeric_state), head_params(head),
+                             float(head.timestep_len), seed)
+
+
+# ## Nearest binding sites, as in ThinFace.nearest_index
+@njit(cache=True)
+def nearest_sites(thin_flat, face_sites, head_face, axial_locations,
+                  hiding_line):
+    """Nearest binding site to each head on its opposing thin face
+
+    Takes:
+        thin_flat: flattened thin filament node locations
+        face_sites: (faces, sites) array of the flat node index of each
+            site on each face, in axial order
+        head_face: which row of face_sites each head looks to
+        axial_locations: axial location of each head
+        hiding_line: location below which sites are hidden
+    Returns:
+        sites: flat node index of the nearest site to each head
+    """
+    n_sites = face_sites.shape[1]
+    sites = np.empty(len(head_face), dtype=face_sites.dtype)
+    for i in range(len(head_face)):
+        row = face_sites[head_face[i]]
+        loc = max(hiding_line, axial_locations[i])
+        # Search for the first site at or beyond the location
+        lo, hi = 0, n_sites
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if thin_flat[row[mid]] < loc:
+                lo = mid + 1
+            else:
+                hi = mid
+        # At a very short SL the end face loc is closest, return the end
+        if lo == n_sites:
+            sites[i] = row[n_sites - 1]
+            continue
+        prev = lo - 1 if lo > 0 else n_sites - 1
+        if abs(thin_flat[row[prev]] - loc) < abs(thin_flat[row[lo]] - loc):
+            sites[i] = row[prev]
+        else:
+            sites[i] = row[lo]
+    return sites
+
+
+# ## Force balance, as in hs._thick_node_forces and hs._thin_node_forces
+@njit(cache=True)
+def _xb_forces(thick, thin, xb_node, xb_bound, xb_state, lattice_spacing,
+               params):
+    """Axial force of each listed cross-bridge, zero for those unbound"""
+    thick_flat, thin_flat = thick.ravel(), thin.ravel()
+    forces = np.zeros(len(xb_node))
+    for i in range(len(xb_node)):
+        if xb_bound[i] >= 0:
+            forces[i] = _axial_force(
+                thin_flat[xb_bound[i]] - thick_flat[xb_node[i]],
+                lattice_spacing, xb_state[i], params)
+    return forces
+
+
+@njit(cache=True)
+def _thick_forces(thick, thick_k, thick_rests, xb_node, xb_forces):
+    """Net axial force at each thick filament node"""
+    rows, nodes = thick.shape
+    out = np.zeros((rows, nodes))
+    for r in range(rows):
+        # Spring behind each node, the last node has none ahead of it
+        behind = (thick[r, 0] - thick_rests[r, 0]) * thick_k[r, 0]
+        for j in range(nodes):
+            if j + 1 < nodes:
+                ahead = (thick[r, j + 1] - thick[r, j] -
+                         thick_rests[r, j + 1]) * thick_k[r, 0]
+            else:
+                ahead = 0.0
+            out[r, j] = ahead - behind
+            behind = ahead
+    out_flat = out.ravel()
+    for i in range(len(xb_node)):
+        out_flat[xb_node[i]] += xb_forces[i]
+    return out
+
+
+@njit(cache=True)
+def _thin_forces(thin, thin_k, thin_rests, z_line, xb_bound, xb_forces):
+    """Net axial force at each thin filament node"""
+    rows, nodes = thin.shape
+    out = np.zeros((rows, nodes))
+    for r in range(rows):
+        # Spring behind each node, the first node has none behind it
+        behind = 0.0
+        for j in range(nodes):
+            if j + 1 < nodes:
+                ahead = (thin[r, j + 1] - thin[r, j] -
+                         thin_rests[r, j]) * thin_k[r, 0]
+            else:
+                ahead = (z_line - thin[r, j] - thin_rests[r, j]) * \
+                    thin_k[r, 0]
+            out[r, j] = ahead - behind
+            behind = ahead
+    out_flat = out.ravel()
+    for i in range(len(xb_bound)):
+        if xb_bound[i] >= 0:
+            out_flat[xb_bound[i]] -= xb_forces[i]
+    return out
+
+
+@njit(cache=True)
+def relax(thick, thin, thick_k, thick_rests, thin_k, thin_rests, z_line,
+          xb_node, xb_bound, xb_state, lattice_spacing, params, factor,
+          converge_limit):
+    """Relaxation sweeps until balanced, as the relax solver of hs.settle
+
+    The thick and thin location arrays are updated in place. The
+    cross-bridge arrays need only list the bound heads, as hs._bound does.
+
+    Returns:
+        sweeps: the number of sweeps taken
+    """
+    sweeps = 0
+    while True:
+        residual = 0.0
+        # Thick filaments, the last node has a spring on only one side
+        forces = _xb_forces(thick, thin, xb_node, xb_bound, xb_state,
+                            lattice_spacing, params)
+        node = _thick_forces(thick, thick_k, thick_rests, xb_node, forces)
+        for r in range(thick.shape[0]):
+            shift = 0.0
+            for j in range(thick.shape[1]):
+                residual = max(residual, abs(node[r, j]))
+                step = factor * node[r, j] / thick_k[r, 0]
+                if j == thick.shape[1] - 1:
+                    step *= 2
+                shift += step
+                thick[r, j] += shift
+        # Thin filaments, the first node has a spring on only one side
+        forces = _xb_forces(thick, thin, xb_node, xb_bound, xb_state,
+                            lattice_spacing, params)
+        node = _thin_forces(thin, thin_k, thin_rests, z_line, xb_bound,
+                            forces)
+        for r in range(thin.shape[0]):
+            shift = 0.0
+            for j in range(thin.shape[1] - 1, -1, -1):
+                residual = max(residual, abs(node[r, j]))
+                step = factor * node[r, j] / thin_k[r, 0]
+                if j == 0:
+                    step *= 2
+                shift += step
+                thin[r, j] += shift
+        sweeps += 1
+        if residual <= converge_limit:
+            return sweeps
@@ -149,7 +149,6 @@ class ThickFace:
         self.thin_face = thin_face
         self.index = index  # numerical orientation (0-5)
         self.address = ('thick_face', self.parent_filament.index, self.index)
-        self.axial_locations = axial_locations
         # Instantiate the cross-bridges along the face
         self.xb = []
         self.xb_by_crown = []  # Includes levels with no heads
@@ -214,6 +213,7 @@ class ThickFace:
         thickface_d.pop('index')
         thickface_d.pop('parent_filament')
         thickface_d['thin_face'] = thickface_d['thin_face'].address
+        thickface_d['axial_locations'] = list(self.axial_locations)
         thickface_d['xb'] = [xb.to_dict() for xb in thickface_d['xb']]
         thickface_d['xb_by_crown'] = [xb.address if xb is not None else None
                                       for xb in thickface_d['xb_by_crown']]
@@ -226,8 +226,7 @@ class ThickFace:
         # Check for index mismatch
         read, current = tuple(tfd['address']), self.address
         assert read == current, "index mismatch at %s/%s" % (read, current)
-        # Local keys
-        self.axial_locations = tfd['axial_locations']
+        # Local keys, axial locations stay linked to the filament's version
         self.xb_index = tfd['xb_index']
         # Sub-structure and remote keys
         self.thin_face = self.parent_filament.parent_lattice.resolve_address(
@@ -287,6 +286,11 @@ class ThickFace:
         """Return the numeric states (0,1,2) of all cross-bridges"""
         return [xb.numeric_state for xb in self.xb]
 
+    @property
+    def axial_locations(self):
+        """The axial locations of nodes along the face, the filament's own"""
+        return self.parent_filament.axial
+
     @property
     def lattice_spacing(self):
         """Return lattice spacing to the face's opposite number"""
@@ -411,6 +415,7 @@ class ThickFilament:
         bare_zone = 58  # Length of the area before any crowns, nm
         crown_spacing = 14.3  # Spacing between adjacent crowns, nm
         n_cr = 60  # Number of myosin crowns
+        # Axial locations are a view into the lattice's thick location array
         self.axial = [bare_zone + n * crown_spacing for n in range(n_cr)]
         self.rests = np.diff(np.hstack([0, self.axial]))
         # Instantiate the faces
@@ -467,7 +472,7 @@ class ThickFilament:
         thick_d = self.__dict__.copy()
         thick_d.pop('index')
         thick_d.pop('parent_lattice')
-        thick_d['axial'] = list(thick_d['axial'])
+        thick_d['axial'] = list(self.axial)
         thick_d['crowns'] = [crown.to_dict() for crown in thick_d['crowns']]
         thick_d['rests'] = list(thick_d['rests'])
         thick_d['thick_faces'] = [face.to_dict() for face in
@@ -619,6 +624,16 @@ class ThickFilament:
         """Return the numeric states (0,1,2) of each face's cross-bridges"""
         return [face.get_states() for face in self.thick_faces]
 
+    @property
+    def axial(self):
+        """Axial locations of the crowns, a view into the lattice's array"""
+        return self.parent_lattice.thick_axial[self.index]
+
+    @axial.setter
+    def axial(self, new_axial):
+        """Write new crown locations into the lattice's array"""
+        self.parent_lattice.thick_axial[self.index] = new_axial
+
     @property
     def lattice_spacing(self):
         """Return the lattice's spacing"""
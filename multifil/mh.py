@@ -9,16 +9,19 @@ from numpy import pi, sqrt, log, radians
 
 import math as m
 import warnings
+import numpy as np
 import numpy.random as random
 
+# Numeric codes for the kinetic states, as used in the lattice state arrays
+STATES = ("free", "loose", "tight")
+# Numeric codes for the transitions returned by Head.batch_transition
+TRANSITIONS = (None, '12', '21', '23', '32', '31')
+
 
 class Spring:
     """A generic spring, from which we make the myosin heads"""
 
     def __init__(self, config):
-        # noinspection PyArgumentList
-        random.seed()  # Ensure proper seeding
-
         # ## Passed variables
         self.r_w = config['rest_weak']
         self.r_s = config['rest_strong']
@@ -92,15 +95,33 @@ class Spring:
         else:
             warnings.warn("Improper value for spring state")
 
-    def bop(self):
+    def batch_rest(self, numeric_state):
+        """Return the rest values for an array of numeric states (0, 1, 2)"""
+        return np.array((self.r_w, self.r_w, self.r_s))[numeric_state]
+
+    def batch_constant(self, numeric_state):
+        """Return the spring constants for an array of numeric states"""
+        return np.array((self.k_w, self.k_w, self.k_s))[numeric_state]
+
+    def batch_energy(self, spring_val, numeric_state):
+        """Given arrays of lengths/angles and numeric states, return energies
+        """
+        rest = self.batch_rest(numeric_state)
+        return 0.5 * self.batch_constant(numeric_state) * (spring_val - rest) ** 2
+
+    def bop(self, size=None, rng=None):
         """Bop for a new value, given an exponential energy dist
 
         A longer explanation is in singlexb/Crossbridge.py
         Takes:
-            nothing: assumes the spring to be in the unbound state
+            size: number of values to bop for at once (optional)
+            rng: numpy Generator to draw from, numpy.random if not given
         Returns:
-            spring_value: the length or angle of the spring after diffusion"""
-        return random.normal(self.r_w, self.stand_dev)
+            spring_value: the length or angle of the spring after diffusion,
+                an array of them if size is given"""
+        if rng is None:
+            rng = random
+        return rng.normal(self.r_w, self.stand_dev, size)
 
 
 """This class is no longer used. Keeping for line count - AMA"""  # class SingleSpringHead:
@@ -328,9 +349,6 @@ class Head:
         code. All numerical values referenced are discussed in single
         crossbridge PLOS paper.
         """
-        # noinspection PyArgumentList
-        random.seed()  # Ensure proper seeding
-
         # Remember thine kinetic state
         self.state = "free"
         # Create the springs which make up the head
@@ -353,27 +371,30 @@ class Head:
         self.alphaDG = 0.28 * -deltaG
         self.etaDG = 0.68 * -deltaG
 
-    def transition(self, bs, ap):
+    def transition(self, bs, ap, rng=None):
         """Transition to a new state (or not)
 
         Takes:
             bs: relative Crown to Actin distance (x,y)
             ap: Actin binding permissiveness, from 0 to 1
+            rng: numpy Generator to draw from, numpy.random if not given
         Returns:
             boolean: transition that occurred (as string) or None
         """
+        if rng is None:
+            rng = random
         # ## Transitions rates are checked against a random number
-        check = random.rand()
+        check = rng.random()
         # ## Check for transitions depending on the current state
         if self.state == "free":
-            if self._prob(self._bind(bs)) * ap > check:
+            if self._prob(self._bind(bs, rng)) * ap > check:
                 self.state = "loose"
                 return '12'
         elif self.state == "loose":
             if self._prob(self._r23(bs)) > check:
                 self.state = "tight"
                 return '23'
-            elif (1 - self._prob(self._r21(bs))) < check:
+            elif (1 - self._prob(self._r21(bs, rng))) < check:
                 self.state = "free"
                 return '21'
         elif self.state == "tight":
@@ -386,6 +407,79 @@ class Head:
         # Got this far? Than no transition occurred!
         return None
 
+    def batch_transition(self, bs, ap, numeric_state, table=None, rng=None):
+        """Transition many heads to new states (or not) all at once
+
+        This follows transition exactly, one random number per head checked
+        against the same rates, but evaluates the rates for every head with
+        array operations rather than one head at a time.
+        Takes:
+            bs: relative Crown to Actin distances (x_array, y)
+            ap: array of Actin binding permissiveness, from 0 to 1
+            numeric_state: array of current states of each head (0, 1, 2)
+            table: optional RateTable, from rate_table, to look up the
+                bound heads' energies in rather than compute them
+            rng: numpy Generator to draw from, numpy.random if not given
+        Returns:
+            codes: array of transition codes, indices into TRANSITIONS
+        """
+        if rng is None:
+            rng = random
+        axial, lattice_spacing = np.broadcast_arrays(*bs)
+        numeric_state = np.asarray(numeric_state)
+        ap = np.broadcast_to(ap, axial.shape)
+        codes = np.zeros(len(numeric_state), dtype=np.int8)
+        # ## Transitions rates are checked against random numbers
+        check = rng.random(len(numeric_state))
+        # ## Free heads may bind
+        i = np.flatnonzero(numeric_state == 0)
+        sub = (axial[i], lattice_spacing[i])
+        codes[i[self._batch_prob(self._batch_bind(sub, rng)) * ap[i] > check[i]]] = 1
+        # ## Loosely bound heads may power stroke or unbind
+        i = np.flatnonzero(numeric_state == 1)
+        sub = (axial[i], lattice_spacing[i])
+        energies = None if table is None else table.energies(sub)
+        forward = self._batch_prob(self._batch_r23(sub, energies)) > check[i]
+        codes[i[forward]] = 3
+        i, sub = i[~forward], (sub[0][~forward], sub[1][~forward])
+        if energies is not None:
+            energies = (energies[0][~forward], energies[1][~forward])
+        rate = self._batch_r21(sub, energies, rng)
+        codes[i[(1 - self._batch_prob(rate)) < check[i]]] = 2
+        # ## Tightly bound heads may unbind or reverse their power stroke
+        i = np.flatnonzero(numeric_state == 2)
+        sub = (axial[i], lattice_spacing[i])
+        energies = None if table is None else table.energies(sub)
+        forward = self._batch_prob(self._batch_r31(sub, energies)) > check[i]
+        codes[i[forward]] = 5
+        i, sub = i[~forward], (sub[0][~forward], sub[1][~forward])
+        if energies is not None:
+            energies = (energies[0][~forward], energies[1][~forward])
+        rate = self._batch_r32(sub, energies)
+        codes[i[(1 - self._batch_prob(rate)) < check[i]]] = 4
+        return codes
+
+    def rate_table(self, tolerance):
+        """The RateTable for this head's springs, built on first use
+
+        Tables are cached by the spring constants and rest values they
+        were built from, so a head whose springs change gets a new table.
+        The free energy changes, alphaDG and etaDG, are applied when the
+        rates are found and need no new table.
+
+        Takes:
+            tolerance: largest interpolation error allowed in the energies
+        Returns:
+            table: a RateTable
+        """
+        key = tuple([(spring.r_w, spring.r_s, spring.k_w, spring.k_s)
+                     for spring in (self.c, self.g)]) + (tolerance,)
+        if key not in _rate_tables:
+            if len(_rate_tables) >= 8:  # forget the oldest
+                _rate_tables.pop(next(iter(_rate_tables)))
+            _rate_tables[key] = RateTable(self, tolerance)
+        return _rate_tables[key]
+
     def axial_force(self, tip_location):
         """Find the axial force a Head generates at a given location
 
@@ -440,6 +534,69 @@ class Head:
         xb_energy = self.c.energy(ang, state) + self.g.energy(dist, state)
         return xb_energy
 
+    def batch_axial_force(self, tip_location, numeric_state):
+        """Axial forces for arrays of tip locations, as in axial_force
+
+        Takes:
+            tip_location: relative Crown to Actin distances (x_array, y)
+            numeric_state: array of kinetic states (0, 1, or 2)
+        Returns:
+            f_x: array of the axial forces generated by the Heads
+        """
+        (c_ang, g_len) = self._batch_seg_values(tip_location)
+        c_s = self.c.batch_rest(numeric_state)
+        g_s = self.g.batch_rest(numeric_state)
+        c_k = self.c.batch_constant(numeric_state)
+        g_k = self.g.batch_constant(numeric_state)
+        f_x = (g_k * (g_len - g_s) * np.cos(c_ang) +
+               1 / g_len * c_k * (c_ang - c_s) * np.sin(c_ang))
+        return f_x
+
+    def batch_radial_force(self, tip_location, numeric_state):
+        """Radial forces for arrays of tip locations, as in radial_force
+
+        Takes:
+            tip_location: relative Crown to Actin distances (x_array, y)
+            numeric_state: array of kinetic states (0, 1, or 2)
+        Returns:
+            f_y: array of the radial forces generated by the Heads
+        """
+        (c_ang, g_len) = self._batch_seg_values(tip_location)
+        c_s = self.c.batch_rest(numeric_state)
+        g_s = self.g.batch_rest(numeric_state)
+        c_k = self.c.batch_constant(numeric_state)
+        g_k = self.g.batch_constant(numeric_state)
+        f_y = (g_k * (g_len - g_s) * np.sin(c_ang) +
+               1 / g_len * c_k * (c_ang - c_s) * np.cos(c_ang))
+        return f_y
+
+    def batch_axial_stiffness(self, tip_location, numeric_state):
+        """Derivative of the axial force with respect to the axial distance
+
+        This is the analytic slope of batch_axial_force, used to linearize
+        bound cross-bridges when solving for force balance directly.
+        Takes:
+            tip_location: relative Crown to Actin distances (x_array, y)
+            numeric_state: array of kinetic states (0, 1, or 2)
+        Returns:
+            df_x/dx: array of the axial stiffness of the Heads
+        """
+        (c_ang, g_len) = self._batch_seg_values(tip_location)
+        c_s = self.c.batch_rest(numeric_state)
+        g_s = self.g.batch_rest(numeric_state)
+        c_k = self.c.batch_constant(numeric_state)
+        g_k = self.g.batch_constant(numeric_state)
+        sin, cos = np.sin(c_ang), np.cos(c_ang)
+        # d(g_len)/dx = cos(c_ang) and d(c_ang)/dx = -sin(c_ang)/g_len
+        return (g_k * (cos ** 2 + (g_len - g_s) / g_len * sin ** 2) -
+                c_k / g_len ** 2 * (sin ** 2 + 2 * (c_ang - c_s) * sin * cos))
+
+    def batch_energy(self, tip_location, numeric_state):
+        """Energies for arrays of tip locations and numeric states"""
+        (ang, dist) = self._batch_seg_values(tip_location)
+        return (self.c.batch_energy(ang, numeric_state) +
+                self.g.batch_energy(dist, numeric_state))
+
     @property
     def numeric_state(self):
         """Return the numeric state (0, 1, or 2) of the head"""
@@ -466,11 +623,16 @@ class Head:
         """
         return 1 - m.exp(-rate * self.timestep_len)
 
-    def _bind(self, bs):
+    def _batch_prob(self, rate):
+        """Convert an array of rates to probabilities, as in _prob"""
+        return 1 - np.exp(-rate * self.timestep_len)
+
+    def _bind(self, bs, rng=None):
         """Bind (or don't) based on the distance from the Head tip to a Actin
 
         Takes:
             bs: relative Crown to Actin distance (x,y)
+            rng: numpy Generator to draw from, numpy.random if not given
         Returns:
             probability: chance of binding occurring during a timestep
         """
@@ -479,8 +641,8 @@ class Head:
         tip = None
         while bop_right is False:
             # ## Bop the springs to get new values
-            c_ang = self.c.bop()
-            g_len = self.g.bop()
+            c_ang = self.c.bop(rng=rng)
+            g_len = self.g.bop(rng=rng)
             # ## Translate those values to an (x,y) position
             tip = (g_len * m.cos(c_ang), g_len * m.sin(c_ang))
             # ## Only a bop that lands short of the thin fil is valid
@@ -494,7 +656,31 @@ class Head:
         # ## Return the rate
         return rate
 
-    def _r21(self, bs):
+    def _batch_bind(self, bs, rng=None):
+        """Binding rates for arrays of Head tip to Actin distances
+
+        Takes:
+            bs: relative Crown to Actin distances (x_array, y_array)
+            rng: numpy Generator to draw from, numpy.random if not given
+        Returns:
+            rate: array of per ms binding rates, as in _bind
+        """
+        (axial, lattice_spacing) = bs
+        tip_x, tip_y = np.empty(len(axial)), np.empty(len(axial))
+        # ## Bop every head at once, re-bopping only those heads whose tips
+        # landed beyond the thin fil until all are valid
+        rejected = np.arange(len(axial))
+        while len(rejected) > 0:
+            c_ang = self.c.bop(len(rejected), rng)
+            g_len = self.g.bop(len(rejected), rng)
+            tip_x[rejected] = g_len * np.cos(c_ang)
+            tip_y[rejected] = g_len * np.sin(c_ang)
+            rejected = rejected[lattice_spacing[rejected] < tip_y[rejected]]
+        # ## The binding rate is dependent on the exp of the dist
+        distance = np.hypot(axial - tip_x, lattice_spacing - tip_y)
+        return 72 * np.exp(-distance ** 2)
+
+    def _r21(self, bs, rng=None):
         """The reverse transition, from loosely bound to unbound
 
         This depends on the prob r12, the binding prob, which is given
@@ -504,6 +690,7 @@ class Head:
         Takes:
             bs: relative Crown to Actin distance (x,y)
             ap: Actin binding permissiveness, from 0 to 1
+            rng: numpy Generator to draw from, numpy.random if not given
         Returns:
             prob: probability of transition
         """
@@ -513,13 +700,28 @@ class Head:
         # ## Rate, as in pg 1209 of Tanner et al, 2007
         # ## With added reduced-detachment factor, increases dwell time
         try:
-            rate = self._bind(bs) / m.exp(
+            rate = self._bind(bs, rng) / m.exp(
                 unbound_free_energy - loose_free_energy)
         except ZeroDivisionError:
 
             rate = 1
         return float(rate)
 
+    def _batch_r21(self, bs, energies=None, rng=None):
+        """Arrays of loosely bound to unbound rates, as in _r21
+
+        The (loose, tight) energies of the heads may be passed if already
+        known, as from a RateTable.
+        """
+        if energies is None:
+            loose_free_energy = self._batch_free_energy(bs, 1)
+        else:
+            loose_free_energy = self.alphaDG + energies[0]
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            denominator = np.exp(0 - loose_free_energy)
+            rate = self._batch_bind(bs, rng) / denominator
+        return np.where(denominator == 0, 1.0, rate)
+
     def _r23(self, bs):
         """Rate of becoming tightly bound if loosely bound
 
@@ -538,6 +740,13 @@ class Head:
                         0.2 * (loose_energy - tight_energy))))
         return float(rate)
 
+    def _batch_r23(self, bs, energies=None):
+        """Arrays of loosely to tightly bound rates, as in _r23"""
+        if energies is None:
+            energies = (self.batch_energy(bs, 1), self.batch_energy(bs, 2))
+        loose_energy, tight_energy = energies
+        return 0.6 * (1 + np.tanh(6 + 0.2 * (loose_energy - tight_energy)))
+
     def _r32(self, bs):
         """The reverse transition, from tightly to loosely bound
 
@@ -555,6 +764,17 @@ class Head:
             rate = 1
         return float(rate)
 
+    def _batch_r32(self, bs, energies=None):
+        """Arrays of tightly to loosely bound rates, as in _r32"""
+        if energies is None:
+            energies = (self.batch_energy(bs, 1), self.batch_energy(bs, 2))
+        loose_free_energy = self.alphaDG + energies[0]
+        tight_free_energy = self.etaDG + energies[1]
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            denominator = np.exp(loose_free_energy - tight_free_energy)
+            rate = self._batch_r23(bs, energies) / denominator
+        return np.where(denominator == 0, 1.0, rate)
+
     def _r31(self, bs):
         """Per ms rate of unbinding if tightly bound
 
@@ -569,6 +789,14 @@ class Head:
         rate = m.sqrt(0.01 * tight_energy) + 0.02
         return float(rate)
 
+    def _batch_r31(self, bs, energies=None):
+        """Arrays of tightly bound to unbound rates, as in _r31"""
+        if energies is None:
+            tight_energy = self.batch_energy(bs, 2)
+        else:
+            tight_energy = energies[1]
+        return np.sqrt(0.01 * tight_energy) + 0.02
+
     def _free_energy(self, tip_location, state):
         """Free energy of the Head
 
@@ -585,6 +813,17 @@ class Head:
         elif state == "tight":
             return self.etaDG + self.energy(tip_location, state)
 
+    def _batch_free_energy(self, tip_location, numeric_state):
+        """Free energies of Heads at an array of tip locations, all in the
+        given numeric state, as in _free_energy
+        """
+        if numeric_state == 0:
+            return np.zeros(np.shape(tip_location[0]))
+        elif numeric_state == 1:
+            return self.alphaDG + self.batch_energy(tip_location, 1)
+        elif numeric_state == 2:
+            return self.etaDG + self.batch_energy(tip_location, 2)
+
     @staticmethod
     def _seg_values(tip_location):
         """Return the length and angle to the Head tip
@@ -598,6 +837,110 @@ class Head:
         g_len = m.hypot(tip_location[1], tip_location[0])
         return c_ang, g_len
 
+    @staticmethod
+    def _batch_seg_values(tip_location):
+        """Return the lengths and angles to an array of Head tips
+
+        Takes:
+            tip_location: relative Crown to Actin distances (x_array, y)
+        Returns:
+            (c_ang, g_len): arrays of the angles and lengths of the springs
+        """
+        c_ang = np.arctan2(tip_location[1], tip_location[0])
+        g_len = np.hypot(tip_location[1], tip_location[0])
+        return c_ang, g_len
+
+
+# Tables built by Head.rate_table, by spring values and tolerance
+_rate_tables = {}
+
+
+class RateTable:
+    """Energies of a Head's loose and tight states, tabulated over tip
+    locations so that the bound transition rates become table lookups
+
+    The rates out of the bound states (_r23, _r32, _r31, and all of _r21
+    but the stochastic binding rate) depend only on these two energies.
+    They are tabulated on a regular grid of axial separation and lattice
+    spacing and read back by bilinear interpolation. The grid is refined
+    until the interpolation error, checked at the centre of every cell,
+    is no more than the tolerance. Locations off the grid are computed
+    directly.
+    """
+
+    def __init__(self, head, tolerance, axial=(-25.0, 25.0),
+                 lattice_spacing=(10.0, 18.0)):
+        """Build the table for a head's springs
+
+        Parameters:
+            head: the Head whose spring values are tabulated
+            tolerance: largest interpolation error allowed in the energies
+            axial: (low, high) range of axial separations to tabulate
+            lattice_spacing: (low, high) range of lattice spacings
+        """
+        self.c = Spring.__new__(Spring)
+        self.c.from_dict(head.c.to_dict())
+        self.g = Spring.__new__(Spring)
+        self.g.from_dict(head.g.to_dict())
+        self.tolerance = tolerance
+        self.origin = (axial[0], lattice_spacing[0])
+        step = 0.2  # nm, refined below until within tolerance
+        while True:
+            n_x = int(np.ceil((axial[1] - axial[0]) / step)) + 1
+            n_y = int(np.ceil((lattice_spacing[1] - lattice_spacing[0])
+                              / step)) + 1
+            if n_x * n_y > 10 ** 7:
+                raise ValueError("Rate table tolerance %g is too fine"
+                                 % tolerance)
+            x, y = np.meshgrid(axial[0] + step * np.arange(n_x),
+                               lattice_spacing[0] + step * np.arange(n_y),
+                               indexing='ij')
+            self.step = step
+            self.table = self._exact((x, y))
+            centres = (x[:-1, :-1] + step / 2, y[:-1, :-1] + step / 2)
+            error = max([np.max(np.abs(tab - ex)) for tab, ex in
+                         zip(self.energies(centres), self._exact(centres))])
+            if error <= tolerance:
+                self.error = error
+                return
+            # Interpolation error shrinks with the square of the step
+            step *= min(0.5, 0.9 * np.sqrt(tolerance / error))
+
+    def _exact(self, bs):
+        """Loose and tight energies found directly, as Head.batch_energy"""
+        (ang, dist) = Head._batch_seg_values(bs)
+        return [self.c.batch_energy(ang, state) +
+                self.g.batch_energy(dist, state) for state in (1, 2)]
+
+    def energies(self, bs):
+        """Loose and tight energies of heads at the given tip locations
+
+        Takes:
+            bs: relative Crown to Actin distances (x_array, y_array)
+        Returns:
+            (loose, tight): arrays of the energy in each state
+        """
+        axial, lattice_spacing = np.broadcast_arrays(*bs)
+        f_x = (axial - self.origin[0]) / self.step
+        f_y = (lattice_spacing - self.origin[1]) / self.step
+        i_x = np.floor(f_x).astype(int)
+        i_y = np.floor(f_y).astype(int)
+        on_grid = ((i_x >= 0) & (i_x < self.table[0].shape[0] - 1) &
+                   (i_y >= 0) & (i_y < self.table[0].shape[1] - 1))
+        i_x, i_y = np.where(on_grid, i_x, 0), np.where(on_grid, i_y, 0)
+        f_x, f_y = f_x - i_x, f_y - i_y
+        out = [f_x * (f_y * tab[i_x + 1, i_y + 1] +
+                      (1 - f_y) * tab[i_x + 1, i_y]) +
+               (1 - f_x) * (f_y * tab[i_x, i_y + 1] +
+                            (1 - f_y) * tab[i_x, i_y])
+               for tab in self.table]
+        if not np.all(on_grid):
+            off = ~on_grid
+            exact = self._exact((axial[off], lattice_spacing[off]))
+            for energy, value in zip(out, exact):
+                energy[off] = value
+        return out
+
 
 class Crossbridge(Head):
     """A cross-bridge, including status of links to actin sites"""
@@ -610,16 +953,17 @@ class Crossbridge(Head):
             parent_face: the associated thick filament face
             thin_face: the face instance opposite this cross-bridge
         """
-        # Do that super() voodoo that instantiates the parent Head
-        super(Crossbridge, self).__init__()
-
-        # noinspection PyArgumentList
-        random.seed()  # Ensure proper seeding
-
         # What is your name, where do you sit on the parent face?
         self.index = index
         # What log are you a bump upon?
         self.parent_face = parent_face
+        # State and binding partner live in the lattice's arrays, find our row
+        self._lattice = parent_face.parent_filament.parent_lattice
+        self._flat_index = self._lattice._add_crossbridge(self)
+
+        # Do that super() voodoo that instantiates the parent Head
+        super(Crossbridge, self).__init__()
+
         # Remember who thou art squaring off against
         self.thin_face = thin_face
         # How can I ever find you?
@@ -652,6 +996,10 @@ class Crossbridge(Head):
         xbd.pop('c')
         xbd.pop('g')
         xbd.pop('parent_face')
+        xbd.pop('_lattice')
+        xbd.pop('_flat_index')
+        xbd['state'] = self.state
+        xbd['bound_to'] = self.bound_to
         if xbd['bound_to'] is not None:
             xbd['bound_to'] = xbd['bound_to'].address
         xbd['thin_face'] = xbd['thin_face'].address
@@ -680,7 +1028,39 @@ class Crossbridge(Head):
     @property
     def timestep_len(self):
         """Timestep size is stored at the half-sarcomere level"""
-        return self.parent_face.parent_filament.parent_lattice.timestep_len
+        return self._lattice.timestep_len
+
+    @property
+    def state(self):
+        """Kinetic state, a view into the lattice's cross-bridge states"""
+        return STATES[self._lattice.xb_state[self._flat_index]]
+
+    @state.setter
+    def state(self, new_state):
+        """Record the new kinetic state in the lattice's array"""
+        self._lattice.xb_state[self._flat_index] = STATES.index(new_state)
+
+    @property
+    def numeric_state(self):
+        """Return the numeric state (0, 1, or 2) of the head"""
+        return int(self._lattice.xb_state[self._flat_index])
+
+    @property
+    def bound_to(self):
+        """None if unbound, the BindingSite we are bound to otherwise"""
+        site_index = self._lattice.xb_bound[self._flat_index]
+        if site_index < 0:
+            return None
+        return self._lattice._binding_sites[site_index]
+
+    @bound_to.setter
+    def bound_to(self, binding_site):
+        """Record the binding partner's index in the lattice's array"""
+        self._lattice._bound_pairs = None  # found afresh when next needed
+        if binding_site is None:
+            self._lattice.xb_bound[self._flat_index] = -1
+        else:
+            self._lattice.xb_bound[self._flat_index] = binding_site._flat_index
 
     def transition(self, **kwargs):
         """Gather the needed information and try a transition
@@ -705,11 +1085,16 @@ class Crossbridge(Head):
             # Combine the two distances
             distance_to_site = (axial_sep, lattice_spacing)
             # Allow the myosin head to take it from here
-            trans = super(Crossbridge, self).transition(distance_to_site,
-                                                        actin_state)
+            trans = super(Crossbridge, self).transition(
+                distance_to_site, actin_state, self._lattice.rng)
             # Process changes to bound state
             if trans == '12':
                 self.bound_to = actin_site.bind_to(self)
+                instruments = self._lattice.instruments
+                if instruments is not None:
+                    instruments.count('bind_attempts')
+                    if self.bound_to is None:
+                        instruments.count('failed_binds')
                 if self.bound_to is None:
                     self.state = 'free'  # failed to bind TODO fix this
                     # import sys
@@ -724,8 +1109,8 @@ class Crossbridge(Head):
             distance_to_site = self._dist_to_bound_actin()
             actin_state = self.bound_to.permissiveness
             # Allow the myosin head to take it from here
-            trans = super(Crossbridge, self).transition(distance_to_site,
-                                                        actin_state)
+            trans = super(Crossbridge, self).transition(
+                distance_to_site, actin_state, self._lattice.rng)
             # Process changes to the bound state
             if trans in {'21', '31'}:
                 self.bound_to = self.bound_to.unbind()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+benchmark.py - track how long it takes to get going
+
+Queue workers start a new interpreter for every job, so the time taken to
+import multifil and build a half-sarcomere is paid once per run. These
+helpers time both in fresh interpreters so that regressions are easy to
+spot.
+
+Example
+--------
+>>> from multifil.utilities import benchmark
+>>> benchmark.import_time()
+{'module': 'multifil', 'repeats': 5, 'mean': ..., 'min': ..., 'max': ...}
+"""
+
+import sys
+import subprocess
+import numpy as np
+
+
+_TIMER = """
+import time
+tic = time.perf_counter()
+%s
+print(time.perf_counter() - tic)
+"""
+
+
+def _time_in_fresh_interpreter(statement, repeats):
+    """Time a statement in new interpreters, giving a list of seconds"""
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', _TIMER % statement],
+                                stdout=subprocess.PIPE, check=True)
+        times.append(float(result.stdout.decode().split()[-1]))
+    return times
+
+
+def _summarize(times, **kwargs):
+    """Reduce a list of times to the summary dict the benchmarks return"""
+    summary = dict(kwargs)
+    summary['repeats'] = len(times)
+    summary['mean'] = float(np.mean(times))
+    summary['min'] = float(np.min(times))
+    summary['max'] = float(np.max(times))
+    return summary
+
+
+def import_time(module='multifil', repeats=5):
+    """How long does a fresh interpreter take to import a module?
+
+    Parameters:
+        module: name of the module to import ('multifil')
+        repeats: number of fresh interpreters to time (5)
+    Returns:
+        summary: dict of the module, repeats, and mean/min/max seconds
+    """
+    times = _time_in_fresh_interpreter('import ' + module, repeats)
+    return _summarize(times, module=module)
+
+
+def startup_time(repeats=5):
+    """How long does a fresh interpreter take to import and build a sarc?
+
+    Parameters:
+        repeats: number of fresh interpreters to time (5)
+    Returns:
+        summary: dict of the repeats and mean/min/max seconds
+    """
+    times = _time_in_fresh_interpreter(
+        'import multifil\nmultifil.hs.hs()', repeats)
+    return _summarize(times)
+
+
+def main(argv=None):
+    """Print import and startup times"""
+    if argv is None:
+        argv = sys.argv[1:]
+    repeats = int(argv[0]) if argv else 5
+    for summary in (import_time('multifil', repeats),
+                    import_time('multifil.aws', repeats),
+                    startup_time(repeats)):
+        print(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
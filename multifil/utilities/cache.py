@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+cache.py - a store of run results, found by what the runs simulated
+
+A seeded run is repeatable: the same meta file settings, model version, and
+seed give the same results. The cache keeps the output files of finished
+runs under a hash of just these, so that a run already done, as in a sweep
+resubmitted with a few new points, can be answered from the store rather
+than simulated again. The store is a directory and may be shared by the
+workers of a machine or of a shared file system. Once it passes its size
+limit the least recently used results are removed.
+
+Directory layout:
+    <key>/: one folder per stored run
+        manifest.json: the key, what it was found from, and the stored
+            files and their total size; its modified time is the latest
+            use
+        <suffix>: each output file, named by what followed the run's name,
+            such as data.json or trajectory.gz
+
+Example
+--------
+>>> from multifil.utilities import cache
+>>> store = cache.result_cache('~/.multifil/cache', max_size=10e9)
+>>> key = store.key(meta, seed=meta['seed'], version=1.3)
+>>> store.get(key) is None
+True
+"""
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import numpy as np
+
+from multifil.utilities import json
+
+
+# Meta file entries that don't change what is simulated
+IGNORED = ('name', 'comment', 'path_local', 'path_s3')
+
+
+def _canonical(value):
+    """A value made plain JSON, so that equal settings hash equally"""
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': value.entropy, 'spawn_key': list(value.spawn_key)}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class result_cache:
+    """A size-limited store of run output files, by the hash of the run"""
+
+    def __init__(self, path, max_size=None):
+        """Open the store at a directory, creating it if needed
+
+        Parameters:
+            path: directory of the store
+            max_size: bytes the stored files may take up before the least
+                recently used are removed, no limit if None
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(meta, seed, version, **settings):
+        """The hash of what a run simulates
+
+        Parameters:
+            meta: the run's meta dict, of which all but the IGNORED
+                entries are hashed
+            seed: the seed the run was started with, an int or a numpy
+                SeedSequence
+            version: the model's version, hs.hs().version
+            **settings: anything else changing the results, such as what
+                output files are written
+        Returns:
+            key: hex digest of the canonical JSON of the above, or None if
+                no seed is given as the run can't then be repeated
+        """
+        if seed is None:
+            return None
+        keyed = {k: v for k, v in meta.items() if k not in IGNORED}
+        keyed.update(seed=seed, version=version, settings=settings)
+        canonical = json.dumps(_canonical(keyed), sort_keys=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _entry(self, key, name=''):
+        """Location of a stored run, or of a file in it"""
+        return os.path.join(self.path, key, name)
+
+    def get(self, key):
+        """Find a stored run, marking it as just used
+
+        Parameters:
+            key: as given by key
+        Returns:
+            files: dict of the location of each stored file by its suffix,
+                None if the run isn't stored
+        """
+        if key is None:
+            return None
+        manifest = self._entry(key, 'manifest.json')
+        try:
+            with open(manifest, 'r') as manifest_file:
+                suffixes = json.load(manifest_file)['files']
+            os.utime(manifest)
+        except FileNotFoundError:
+            return None  # not stored, or evicted as it was read
+        return {suffix: self._entry(key, suffix) for suffix in suffixes}
+
+    def put(self, key, name, filenames, **description):
+        """Store a finished run's output files
+
+        The files are copied into a new folder that is renamed into place
+        once complete, so a run stored by two workers at once is kept once
+        and a reader never finds half a run.
+
+        Parameters:
+            key: as given by key
+            name: the run's name, which each filename starts with
+            filenames: the locations of the run's output files
+            **description: JSON compatible values kept in the manifest
+        """
+        if key is None or os.path.exists(self._entry(key)):
+            return
+        staging = os.path.join(self.path, '.tmp-' + uuid.uuid4().hex)
+        os.makedirs(staging)
+        files, size = [], 0
+        for filename in filenames:
+            suffix = os.path.basename(filename).split(name, 1)[-1].lstrip('.')
+            shutil.copyfile(filename, os.path.join(staging, suffix))
+            files.append(suffix)
+            size += os.path.getsize(filename)
+        with open(os.path.join(staging, 'manifest.json'), 'w') as manifest:
+            json.dump(dict(description, key=key, files=files, size=size,
+                           stored=time.time()), manifest, sort_keys=True)
+        try:
+            os.rename(staging, self._entry(key))
+        except OSError:
+            shutil.rmtree(staging)  # stored by another worker meanwhile
+        self.evict()
+
+    def entries(self):
+        """The stored runs, least recently used first
+
+        Returns:
+            entries: list of (last used time, size in bytes, key)
+        """
+        entries = []
+        for key in os.listdir(self.path):
+            manifest = self._entry(key, 'manifest.json')
+            try:
+                used = os.path.getmtime(manifest)
+                with open(manifest, 'r') as manifest_file:
+                    size = json.load(manifest_file)['size']
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # staging, or removed meanwhile
+            entries.append((used, size, key))
+        return sorted(entries)
+
+    def size(self):
+        """Bytes taken up by the stored files"""
+        return sum([size for _, size, _ in self.entries()])
+
+    def evict(self):
+        """Remove the least recently used runs until under max_size"""
+        if self.max_size is None:
+            return
+        entries = self.entries()
+        total = sum([size for _, size, _ in entries])
+        for _, size, key in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+columns.py - columnar, append-only storage of per-timestep values
+
+Each column holds one value per timestep. Rows are gathered in preallocated
+arrays and written out a chunk at a time, so that keeping a file current
+through a run only ever appends to it. Any one column can be read back
+without reading the others.
+
+File layout:
+    magic: b'MFCOL1\\n'
+    header: uint32 length, then JSON of the column names, dtypes, and the
+        shape of each row's value (empty for a single number) and of any
+        attributes, such as the run's name
+    chunks: each a uint32 length and JSON giving its number of rows, then
+        each column's values for those rows in turn, in the column order
+        of the header
+
+Example
+--------
+>>> from multifil.utilities import columns
+>>> with columns.writer('run.data.columns', ['timestep', 'axial_force'],
+...                     dtypes={'timestep': 'i8'}) as cols:
+...     cols.append({'timestep': 1, 'axial_force': 12.5})
+>>> columns.read('run.data.columns', ['axial_force'])
+{'axial_force': array([12.5])}
+"""
+
+import shutil
+import struct
+import numpy as np
+
+from multifil.utilities import json
+
+
+MAGIC = b'MFCOL1\n'
+_LENGTH = struct.Struct('<I')
+
+
+class writer:
+    """Append rows of per-timestep values to a columnar file"""
+
+    def __init__(self, filename, names, dtypes=None, chunk_size=100,
+                 attributes=None):
+        """Create the file and write its header
+
+        Parameters:
+            filename: where to write the columns
+            names: the name of each column, in order
+            dtypes: optional dict of the numpy dtype of columns that aren't
+                float64, by name; a shaped dtype such as ('f8', (4, 60))
+                gives a column holding an array at each row
+            chunk_size: rows gathered before they are appended (100)
+            attributes: optional dict of JSON compatible values describing
+                the whole file, read back with read_attributes
+        """
+        if dtypes is None:
+            dtypes = {}
+        self.filename = filename
+        self.names = tuple(names)
+        self.dtypes = [_little(np.dtype(dtypes.get(name, 'f8')))
+                       for name in self.names]
+        self.chunk_size = chunk_size
+        self._chunk = [np.empty(chunk_size, dtype) for dtype in self.dtypes]
+        self._rows = 0  # gathered in the chunk, not yet written
+        self.rows = 0  # all the rows appended
+        header = json.dumps({
+            'columns': [[name, dtype.base.str, list(dtype.shape)]
+                        for name, dtype in zip(self.names, self.dtypes)],
+            'attributes': attributes if attributes is not None else {}
+        }).encode()
+        with open(filename, 'wb') as col_file:
+            col_file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def append(self, row):
+        """Add a row, a dict of a value for every column by name"""
+        for column, name in zip(self._chunk, self.names):
+            column[self._rows] = row[name]
+        self._rows += 1
+        self.rows += 1
+        if self._rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Append the rows gathered so far to the file"""
+        if self._rows == 0:
+            return
+        header = json.dumps({'rows': self._rows}).encode()
+        with open(self.filename, 'ab') as col_file:
+            col_file.write(_LENGTH.pack(len(header)) + header)
+            for column in self._chunk:
+                col_file.write(column[:self._rows].tobytes())
+        self._rows = 0
+
+    def read(self, names=None):
+        """Flush, then read back columns as read does"""
+        self.flush()
+        return read(self.filename, names)
+
+
+def _little(dtype):
+    """A dtype, or the base of a shaped one, made little-endian"""
+    return np.dtype((dtype.base.newbyteorder('<'), dtype.shape))
+
+
+def _column_dtype(column):
+    """The dtype of a column header entry of name, base dtype, and shape"""
+    return np.dtype((column[1], tuple(column[2]))) if column[2:] and \
+        column[2] else np.dtype(column[1])
+
+
+def _read_header(col_file):
+    """Check the magic and read the JSON file header from an open file"""
+    if col_file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a multifil columns file")
+    length, = _LENGTH.unpack(col_file.read(_LENGTH.size))
+    return json.loads(col_file.read(length).decode())
+
+
+def read_attributes(filename):
+    """The attributes a columns file was written with"""
+    with open(filename, 'rb') as col_file:
+        return _read_header(col_file)['attributes']
+
+
+def copy(source, destination, attributes):
+    """Copy a columns file, updating its attributes
+
+    Parameters:
+        source: a file written by writer
+        destination: where to write the copy
+        attributes: dict of the attributes to change or add, such as the
+            run's name
+    """
+    with open(source, 'rb') as col_file:
+        header = _read_header(col_file)
+        header['attributes'].update(attributes)
+        header = json.dumps(header).encode()
+        with open(destination, 'wb') as copied:
+            copied.write(MAGIC + _LENGTH.pack(len(header)) + header)
+            shutil.copyfileobj(col_file, copied)
+
+
+def read(filename, names=None):
+    """Read columns from a file, skipping over those not asked for
+
+    Parameters:
+        filename: a file written by writer
+        names: the columns to read, all of them if not given
+    Returns:
+        columns: dict of an array of each column's values, by name, with
+            the rows along its first axis
+    """
+    with open(filename, 'rb') as col_file:
+        header = _read_header(col_file)
+        columns = [(column[0], _column_dtype(column))
+                   for column in header['columns']]
+        if names is None:
+            names = [name for name, _ in columns]
+        unknown = set(names) - set([name for name, _ in columns])
+        if unknown:
+            raise KeyError("No such columns: %s" % ", ".join(sorted(unknown)))
+        blocks = {name: [] for name in names}
+        while True:
+            length = col_file.read(_LENGTH.size)
+            if len(length) < _LENGTH.size:
+                break
+            length, = _LENGTH.unpack(length)
+            rows = json.loads(col_file.read(length).decode())['rows']
+            for name, dtype in columns:
+                size = rows * dtype.itemsize
+                if name in blocks:
+                    blocks[name].append(np.frombuffer(
+                        col_file.read(size), dtype=dtype.base).reshape(
+                            (rows,) + dtype.shape))
+                else:
+                    col_file.seek(size, 1)
+    return {name: np.concatenate(blocks[name]) if blocks[name] else
+            np.empty(0, dict(columns)[name]) for name in names}
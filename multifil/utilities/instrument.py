@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+instrument.py - where the time in a run goes
+
+An instruments object, attached to a half-sarcomere, keeps a row for each
+timestep recording the wall time of each phase of the step and a few
+counters of what the kinetics and the force balance did. It is opt-in and
+costs a handful of clock reads per timestep, plus one residual force
+evaluation after each settle.
+
+Phases timed, in seconds:
+    transition: the cross-bridge kinetics
+    settle: the force balance
+    callback: the callback of hs.run, if run that way
+    output: recording to the data and sarc files in run.manage
+
+Counters:
+    settle_iterations: relaxation sweeps and Newton steps taken
+    residual: largest axial force left at any node after settling
+    bind_attempts: heads whose draw called for binding
+    failed_binds: of those, heads whose site was already taken
+
+Example
+--------
+>>> from multifil import hs
+>>> from multifil.utilities import instrument
+>>> sarc = hs.hs(instruments=instrument.instruments())
+>>> sarc.run(10, bar=False)
+>>> sarc.instruments.arrays()['time_settle']
+array([...])
+"""
+
+import numpy as np
+
+from multifil.utilities import json
+
+
+PHASES = ('transition', 'settle', 'callback', 'output')
+COUNTERS = ('settle_iterations', 'residual', 'bind_attempts',
+            'failed_binds')
+
+
+class instruments:
+    """Timings and counters for each timestep of a half-sarcomere run"""
+
+    def __init__(self):
+        """An empty record, filled as the half-sarcomere is run"""
+        self.record = {key: [] for key in ('timestep',) + COUNTERS +
+                       tuple(['time_' + phase for phase in PHASES])}
+        # Counts made during a timestep, before its row is added
+        self._pending = dict.fromkeys(COUNTERS, 0)
+
+    def __len__(self):
+        return len(self.record['timestep'])
+
+    def count(self, counter, number=1):
+        """Add to a counter of the timestep now underway"""
+        self._pending[counter] += number
+
+    def add_step(self, sarc, **phase_times):
+        """Close out a timestep, adding its row to the record
+
+        Parameters:
+            sarc: the half-sarcomere just stepped, read for its timestep,
+                settle iterations, and residual force
+            **phase_times: seconds taken by each phase, by phase name
+        """
+        pending, self._pending = self._pending, dict.fromkeys(COUNTERS, 0)
+        pending['settle_iterations'] = sarc.last_settle_iterations
+        pending['residual'] = float(np.max(np.abs(sarc._get_residual())))
+        self.record['timestep'].append(sarc.current_timestep)
+        for counter in COUNTERS:
+            self.record[counter].append(pending[counter])
+        for phase in PHASES:
+            self.record['time_' + phase].append(phase_times.get(phase, 0.0))
+
+    def add_time(self, phase, seconds):
+        """Add time taken outside the timestep to its latest row"""
+        if len(self) > 0:
+            self.record['time_' + phase][-1] += seconds
+
+    def arrays(self):
+        """The record as a dict of arrays, one entry per timestep"""
+        return {key: np.array(value) for key, value in self.record.items()}
+
+    def summary(self):
+        """Total time of each phase and totals or extremes of each counter
+
+        Returns:
+            summary: dict of the seconds spent in each phase, as
+                time_<phase>, and of the total settle_iterations,
+                bind_attempts, and failed_binds and the largest residual
+        """
+        record = self.arrays()
+        summary = {key: float(np.sum(record[key])) for key in record
+                   if key.startswith('time_')}
+        for counter in ('settle_iterations', 'bind_attempts', 'failed_binds'):
+            summary[counter] = int(np.sum(record[counter]))
+        summary['residual'] = float(np.max(record['residual'], initial=0))
+        return summary
+
+    def write(self, filename):
+        """Write the record to a JSON file, as beside a run's data file"""
+        with open(filename, 'w') as instrument_file:
+            json.dump(self.record, instrument_file, sort_keys=True)
+        return filename
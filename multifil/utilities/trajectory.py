@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+trajectory.py - compact records of a half-sarcomere's state through a run
+
+Writing sarc.to_dict() at every timestep records everything, but mostly
+records the same thing again: the lattice's structure never changes and few
+cross-bridges change state in any one step. A trajectory instead holds a
+keyframe of the full lattice state every few steps and, between them, only
+the filament locations (as float32) and the cross-bridges whose state or
+binding changed. The stream is gzip compressed as it is written.
+
+File layout, within the gzip stream:
+    magic: b'MFTRAJ1\\n'
+    header: uint32 length, then JSON of the lattice shapes, the keyframe
+        interval, and the settings the half-sarcomere was created with
+    frames: one per append, each a kind byte, K for a keyframe or D for a
+        delta, then the timestep (int64), z-line and lattice spacing
+        (float64) and the thick then thin filament locations (float32).
+        Keyframes follow these with every cross-bridge's state (int8) and
+        bound site (int32), deltas with a count (uint32) and the index
+        (int32), new state (int8) and new bound site (int32) of each
+        cross-bridge that changed. Both end with a flag byte, set if the
+        binding site permissiveness (float32) follows, as it always does
+        in a keyframe.
+
+Example
+--------
+>>> from multifil import hs
+>>> from multifil.utilities import trajectory
+>>> sarc = hs.hs()
+>>> with trajectory.writer('run.traj.gz', sarc) as traj:
+...     for _ in range(10):
+...         sarc.timestep()
+...         traj.append()
+>>> trajectory.load('run.traj.gz')['thick_axial'].shape
+(10, 4, 60)
+"""
+
+import gzip
+import struct
+import numpy as np
+
+from multifil.utilities import json
+
+
+MAGIC = b'MFTRAJ1\n'
+_SCALARS = struct.Struct('<qdd')  # timestep, z-line, lattice spacing
+_LENGTH = struct.Struct('<I')
+
+
+class writer:
+    """Write the state of a half-sarcomere at each append"""
+
+    def __init__(self, filename, sarc, keyframe_every=100, compresslevel=6):
+        """Open the trajectory file and write its header
+
+        Parameters:
+            filename: where to write the trajectory
+            sarc: the hs.hs to record
+            keyframe_every: steps from one full keyframe to the next (100)
+            compresslevel: gzip level, 1 is fastest and 9 smallest (6)
+        """
+        self.sarc = sarc
+        self.keyframe_every = keyframe_every
+        self.filename = filename
+        self._file = gzip.open(filename, 'wb', compresslevel=compresslevel)
+        header = json.dumps({
+            'keyframe_every': keyframe_every,
+            'thick_shape': list(sarc.thick_axial.shape),
+            'thin_shape': list(sarc.thin_axial.shape),
+            'n_xb': int(sarc.xb_state.size),
+            'settings': json.loads(sarc._settings())}).encode()
+        self._file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        self.frames = 0
+        # What the last frame recorded, to find the changes from
+        self._xb_state = None
+        self._xb_bound = None
+        self._permissiveness = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self):
+        """Record the half-sarcomere's current state"""
+        sarc = self.sarc
+        keyframe = self.frames % self.keyframe_every == 0
+        out = [b'K' if keyframe else b'D',
+               _SCALARS.pack(int(sarc.current_timestep), float(sarc.z_line),
+                             float(sarc.lattice_spacing)),
+               sarc.thick_axial.astype('<f4').tobytes(),
+               sarc.thin_axial.astype('<f4').tobytes()]
+        if keyframe:
+            out += [sarc.xb_state.astype('<i1').tobytes(),
+                    sarc.xb_bound.astype('<i4').tobytes()]
+        else:
+            changed = np.flatnonzero((sarc.xb_state != self._xb_state) |
+                                     (sarc.xb_bound != self._xb_bound))
+            out += [_LENGTH.pack(len(changed)),
+                    changed.astype('<i4').tobytes(),
+                    sarc.xb_state[changed].astype('<i1').tobytes(),
+                    sarc.xb_bound[changed].astype('<i4').tobytes()]
+        permissiveness = sarc.bs_permissiveness
+        if keyframe or not np.array_equal(permissiveness,
+                                          self._permissiveness):
+            out += [b'\x01', permissiveness.astype('<f4').tobytes()]
+        else:
+            out += [b'\x00']
+        self._file.write(b''.join(out))
+        self._xb_state = sarc.xb_state.copy()
+        self._xb_bound = sarc.xb_bound.copy()
+        self._permissiveness = permissiveness.copy()
+        self.frames += 1
+
+    def close(self):
+        """Finish the gzip stream and close the file"""
+        self._file.close()
+
+
+class reader:
+    """Read a trajectory back, frame by frame"""
+
+    def __init__(self, filename):
+        """Open the trajectory and read its header
+
+        Parameters:
+            filename: a trajectory written by writer
+        """
+        self.filename = filename
+        with gzip.open(filename, 'rb') as traj:
+            self.header = self._read_header(traj)
+        self.settings = self.header['settings']
+
+    @staticmethod
+    def _read_header(traj):
+        """Check the magic and read the JSON header from an open file"""
+        if traj.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a multifil trajectory")
+        length, = _LENGTH.unpack(traj.read(_LENGTH.size))
+        return json.loads(traj.read(length).decode())
+
+    def __iter__(self):
+        """Yield the state at each frame as a dict of arrays
+
+        Each frame holds the timestep, z_line, and lattice_spacing, the
+        thick_axial and thin_axial locations, the xb_state and xb_bound of
+        each cross-bridge, and the bs_permissiveness of each site.
+        """
+        thick_shape = tuple(self.header['thick_shape'])
+        thin_shape = tuple(self.header['thin_shape'])
+        n_thick, n_thin = np.prod(thick_shape), np.prod(thin_shape)
+        n_xb = self.header['n_xb']
+        xb_state = xb_bound = permissiveness = None
+        with gzip.open(self.filename, 'rb') as traj:
+            self._read_header(traj)
+            while True:
+                kind = traj.read(1)
+                if kind == b'':
+                    return
+                timestep, z_line, lattice_spacing = _SCALARS.unpack(
+                    traj.read(_SCALARS.size))
+                thick = _read_array(traj, '<f4', n_thick).reshape(thick_shape)
+                thin = _read_array(traj, '<f4', n_thin).reshape(thin_shape)
+                if kind == b'K':
+                    xb_state = _read_array(traj, '<i1', n_xb).astype(np.int8)
+                    xb_bound = _read_array(traj, '<i4', n_xb).astype(np.intp)
+                else:
+                    xb_state, xb_bound = xb_state.copy(), xb_bound.copy()
+                    count, = _LENGTH.unpack(traj.read(_LENGTH.size))
+                    changed = _read_array(traj, '<i4', count)
+                    xb_state[changed] = _read_array(traj, '<i1', count)
+                    xb_bound[changed] = _read_array(traj, '<i4', count)
+                if traj.read(1) == b'\x01':
+                    permissiveness = _read_array(
+                        traj, '<f4', n_thin).reshape(thin_shape)
+                yield {'timestep': timestep, 'z_line': z_line,
+                       'lattice_spacing': lattice_spacing,
+                       'thick_axial': thick, 'thin_axial': thin,
+                       'xb_state': xb_state, 'xb_bound': xb_bound,
+                       'bs_permissiveness': permissiveness}
+
+
+def _read_array(traj, dtype, count):
+    """Read count values of dtype from an open file"""
+    dtype = np.dtype(dtype)
+    return np.frombuffer(traj.read(dtype.itemsize * count), dtype=dtype)
+
+
+def load(filename):
+    """Read a whole trajectory into arrays stacked over its frames
+
+    Parameters:
+        filename: a trajectory written by writer
+    Returns:
+        trajectory: dict of each frame entry, see reader, stacked so that
+            the first axis of each is the frame
+    """
+    frames = list(reader(filename))
+    if len(frames) == 0:
+        return {}
+    return {key: np.array([frame[key] for frame in frames])
+            for key in frames[0]}